@@ -501,12 +501,12 @@ class RiggingMainUI(QtWidgets.QWidget):
         # export skin weights btn
         skinExportBtn = QtWidgets.QPushButton('Export Skin')
         skinLayout.addWidget(skinExportBtn)
-        skinExportBtn.clicked.connect(skinLib.SkinCluster.export)
+        skinExportBtn.clicked.connect(lambda: skinLib.SkinCluster.exportAsync())
 
         # import skin weights btn
         skinImportBtn = QtWidgets.QPushButton('Import Skin')
         skinLayout.addWidget(skinImportBtn)
-        skinImportBtn.clicked.connect(skinLib.SkinCluster.createAndImport)
+        skinImportBtn.clicked.connect(lambda: skinLib.SkinCluster.importAsync(interactive=True))
 
     def clearRig(self):
         for rig in self.rigScrollWidget.findChildren(rigWidget):
@@ -0,0 +1,805 @@
+"""
+fakeMaya @ skinLib
+
+Stand-in for the parts of maya.cmds, maya.OpenMaya, maya.OpenMayaAnim and their API 2.0 versions used
+by skinLib, so the skin IO code paths can be benchmarked on machines without Maya:
+    import fakeMaya
+    scene = fakeMaya.install()
+    import skinLib
+The skinClusters hold their weights in CSR arrays like the real node holds its sparse weight lists,
+and the API arrays are compact C arrays filled in one call, so the time and memory measured are the
+ones spent by skinLib and not by the stand-in.
+Only the behaviour skinLib relies on is implemented.
+"""
+
+import os
+import imp
+import sys
+import array
+import types
+import numpy as np
+
+import weightUtils
+
+
+class Scene(object):
+    """
+    class holding the nodes of the fake scene
+    """
+
+    def __init__(self):
+        # {shape: {'transform': str, 'points': (n x 3) array, 'triangles': (t x 3) array, 'faces': int}}
+        self.meshes = {}
+        # {skinCluster: {'geometry': shape, 'influences': list(str), 'offsets', 'indices', 'values',
+        #                'blendWeights': array, 'skinningMethod': int, 'normalizeWeights': int}}
+        self.skinClusters = {}
+        self.joints = []
+        # {callback id: function} of the DG message callbacks, called when a node is created
+        self.callbacks = {}
+        # {command name: MPxCommand creator} of the loaded plugins
+        self.commands = {}
+        # undoable commands in the order they ran, the commands after undoIndex were undone
+        self.undoQueue = []
+        self.undoIndex = 0
+        self.undoState = True
+
+    def clear(self):
+        self.meshes.clear()
+        self.skinClusters.clear()
+        del self.joints[:]
+        del self.undoQueue[:]
+        self.undoIndex = 0
+        self.nodeAdded()
+
+    def nodeAdded(self):
+        for function in list(self.callbacks.values()):
+            function(None, None)
+
+    def addCallback(self, function):
+        """
+        :param function: callable, called with (MObject, clientData) on every change
+        :return: int, callback id
+        """
+        callbackId = max(self.callbacks.keys() or [0]) + 1
+        self.callbacks[callbackId] = function
+        return callbackId
+
+    def nodeType(self, node):
+        """
+        :param node: str, node name
+        :return: str, node type or None if the node does not exist
+        """
+        node = node.split('.')[0].split('|')[-1]
+        if node in self.meshes:
+            return 'mesh'
+        if node in self.skinClusters:
+            return 'skinCluster'
+        if node in self.joints:
+            return 'joint'
+        if any(mesh['transform'] == node for mesh in self.meshes.values()):
+            return 'transform'
+        return None
+
+    def createMesh(self, name, numVertices):
+        """
+        Create a grid mesh in the xz plane with about numVertices vertices and unit spacing
+        :param name: str, transform name, the shape is called name + 'Shape'
+        :param numVertices: int, number of vertices, rounded to a full grid row
+        :return: str, shape name
+        """
+        columns = max(int(np.sqrt(numVertices)), 2)
+        rows = max(-(-numVertices // columns), 2)
+        x, z = np.meshgrid(np.arange(columns, dtype=np.float64), np.arange(rows, dtype=np.float64))
+        points = np.column_stack([x.ravel(), np.zeros(x.size), z.ravel()])
+
+        # two triangles per grid quad
+        corners = (np.arange(rows - 1)[:, None] * columns + np.arange(columns - 1)[None, :]).ravel()
+        triangles = np.concatenate([np.column_stack([corners, corners + columns, corners + 1]),
+                                    np.column_stack([corners + 1, corners + columns, corners + columns + 1])])
+
+        shape = name + 'Shape'
+        self.meshes[shape] = {'transform': name,
+                              'points': points,
+                              'triangles': triangles.astype(np.int32),
+                              'faces': len(corners)}
+        self.nodeAdded()
+        return shape
+
+    def createJoints(self, numJoints, prefix='joint'):
+        """
+        :param numJoints: int
+        :param prefix: str, joint name prefix
+        :return: list(str), joint names
+        """
+        joints = ['%s%d' % (prefix, ii) for ii in xrange(numJoints)]
+        self.joints.extend(j for j in joints if j not in self.joints)
+        self.nodeAdded()
+        return joints
+
+    def createSkinCluster(self, shape, influences, weights=None, name=None):
+        """
+        Bind the shape to the influences
+        :param shape: str, mesh shape
+        :param influences: list(str), joint names
+        :param weights: numpy.ndarray, (vertices x influences) weights or (offsets, indices, values) CSR arrays,
+                        None binds everything to the first influence
+        :param name: str, skinCluster name
+        :return: str, skinCluster name
+        """
+        numVertices = len(self.meshes[shape]['points'])
+        if weights is None:
+            offsets = np.arange(numVertices + 1, dtype=np.int64)
+            indices = np.zeros(numVertices, dtype=np.int32)
+            values = np.ones(numVertices)
+        elif isinstance(weights, tuple):
+            offsets, indices, values = weights
+        else:
+            offsets, indices, values = weightUtils.denseToSparse(weights)
+
+        name = name or 'skinCluster1'
+        index = 1
+        while name in self.skinClusters:
+            index += 1
+            name = '%s%d' % (name.rstrip('0123456789'), index)
+
+        self.skinClusters[name] = {'geometry': shape,
+                                   'influences': list(influences),
+                                   'offsets': offsets,
+                                   'indices': indices,
+                                   'values': values,
+                                   'blendWeights': np.zeros(numVertices),
+                                   'skinningMethod': 0,
+                                   'normalizeWeights': 1}
+        self.nodeAdded()
+        return name
+
+    def skinClusterOf(self, shape):
+        """
+        :param shape: str, mesh shape
+        :return: str, skinCluster deforming the shape or None
+        """
+        for name, skin in self.skinClusters.items():
+            if skin['geometry'] == shape:
+                return name
+        return None
+
+
+scene = Scene()
+
+
+def shortName(node):
+    """
+    :param node: str, node name, path or attribute
+    :return: str, node name without the dag path and the attribute
+    """
+    return node.split('.')[0].split('|')[-1]
+
+
+# --------------------------------------------------------------------------------------------------
+# maya.OpenMaya
+# --------------------------------------------------------------------------------------------------
+
+class MFn(object):
+    kMeshVertComponent = 550
+
+
+class MDoubleArray(array.array):
+    """
+    MDoubleArray(), MDoubleArray(length) or MDoubleArray(pointer, length)
+    """
+    kTypeCode = 'd'
+    kDtype = np.float64
+
+    def __new__(cls, *args):
+        if len(args) == 2:
+            return array.array.__new__(cls, cls.kTypeCode, args[0][:args[1]])
+        if len(args) == 1 and isinstance(args[0], (int, long)):
+            return array.array.__new__(cls, cls.kTypeCode, np.zeros(args[0], dtype=cls.kDtype).tostring())
+        return array.array.__new__(cls, cls.kTypeCode, *args)
+
+    def length(self):
+        return len(self)
+
+    def set(self, value, index):
+        self[index] = value
+
+    def assignNumpy(self, values):
+        """
+        replace the content with a numpy array in one copy, like the API fills its arrays
+        """
+        del self[:]
+        self.fromstring(np.ascontiguousarray(values, dtype=self.kDtype).tostring())
+
+    def asNumpy(self):
+        """
+        :return: numpy.ndarray, view of the content
+        """
+        if not len(self):
+            return np.zeros(0, dtype=self.kDtype)
+        return np.frombuffer(self, dtype=self.kDtype)
+
+
+class MIntArray(MDoubleArray):
+    kTypeCode = 'i'
+    kDtype = np.int32
+
+
+class MScriptUtil(object):
+
+    def __init__(self):
+        self.values = []
+
+    def createFromList(self, values, length):
+        self.values = values[:length]
+
+    def createFromInt(self, value):
+        self.values = [value]
+
+    def asDoublePtr(self):
+        return self.values
+
+    def asIntPtr(self):
+        return self.values
+
+    def asUintPtr(self):
+        return self.values
+
+
+class MObject(object):
+    """
+    an MObject holds the name of a node, or the vertex indices of a component
+    """
+
+    def __init__(self, node=None):
+        self.node = node
+        # numpy vertex indices of a component, None for a complete component
+        self.elements = None
+        self.component = False
+
+    def isNull(self):
+        return self.node is None and not self.component
+
+    def hasFn(self, fnType):
+        return self.component and fnType == MFn.kMeshVertComponent
+
+    def assign(self, other):
+        self.node = other.node
+        self.elements = other.elements
+        self.component = other.component
+
+
+class MDagPath(object):
+
+    def __init__(self, node=None):
+        self.node = node
+
+    def partialPathName(self):
+        return self.node
+
+    def fullPathName(self):
+        return '|' + self.node
+
+
+class MDagPathArray(list):
+
+    def length(self):
+        return len(self)
+
+
+class MSelectionList(object):
+
+    def __init__(self):
+        # list of (node, component MObject or None)
+        self.items = []
+
+    def add(self, node):
+        self.items.append((shortName(node), None))
+
+    def length(self):
+        return len(self.items)
+
+    def getDependNode(self, index, mobj):
+        mobj.node = self.items[index][0]
+
+    def getDagPath(self, index, dagPath, component=None):
+        node, itemComponent = self.items[index]
+        dagPath.node = node
+        if component is not None and itemComponent is not None:
+            component.assign(itemComponent)
+
+
+class MFnSingleIndexedComponent(object):
+
+    def __init__(self, component=None):
+        self.component = component
+
+    def create(self, fnType):
+        self.component = MObject()
+        self.component.component = True
+        self.component.elements = np.zeros(0, dtype=np.int64)
+        return self.component
+
+    def addElements(self, elements):
+        self.component.elements = np.concatenate([self.component.elements, elements.asNumpy().astype(np.int64)])
+
+    def isComplete(self):
+        return self.component.elements is None
+
+    def getElements(self, elements):
+        elements.assignNumpy(self.component.elements)
+
+
+class MFnSet(object):
+
+    def __init__(self, mobj):
+        # the deformer set of a skinCluster is represented by the skinCluster
+        self.skinCluster = mobj.node
+
+    def getMembers(self, members, flatten):
+        shape = scene.skinClusters[self.skinCluster]['geometry']
+        component = MObject()
+        component.component = True
+        members.items.append((shape, component))
+
+
+class MFnMesh(object):
+
+    def __init__(self, dagPath):
+        self.mesh = scene.meshes[dagPath.node]
+
+    def numVertices(self):
+        return len(self.mesh['points'])
+
+    def getTriangles(self, triangleCounts, triangleVertices):
+        triangleCounts.assignNumpy(np.full(self.mesh['faces'], 2))
+        triangleVertices.assignNumpy(self.mesh['triangles'].ravel())
+
+    def numEdges(self):
+        return polyEvaluate(self.mesh['transform'] + 'Shape', edge=True)
+
+    def getVertices(self, vertexCounts, vertices):
+        # the quads are rebuilt from their two triangles
+        numFaces = self.mesh['faces']
+        first, second = self.mesh['triangles'][:numFaces], self.mesh['triangles'][numFaces:]
+        vertexCounts.assignNumpy(np.full(numFaces, 4))
+        vertices.assignNumpy(np.column_stack([first[:, 0], first[:, 1], second[:, 2], first[:, 2]]).ravel())
+
+
+class MGlobal(object):
+
+    @staticmethod
+    def getActiveSelectionList(selectionList):
+        pass
+
+
+class MMessage(object):
+
+    @staticmethod
+    def removeCallback(callbackId):
+        scene.callbacks.pop(callbackId, None)
+
+
+class MDGMessage(object):
+    """
+    the fake scene only creates nodes, all the callbacks are called when a node is created
+    """
+
+    @staticmethod
+    def addNodeAddedCallback(function, nodeType='dependNode'):
+        return scene.addCallback(function)
+
+    @staticmethod
+    def addNodeRemovedCallback(function, nodeType='dependNode'):
+        return scene.addCallback(function)
+
+    @staticmethod
+    def addConnectionCallback(function):
+        return scene.addCallback(function)
+
+
+class MNodeMessage(object):
+
+    @staticmethod
+    def addNameChangedCallback(mobj, function):
+        return scene.addCallback(function)
+
+
+class MDagMessage(object):
+
+    @staticmethod
+    def addAllDagChangesCallback(function):
+        return scene.addCallback(function)
+
+
+# --------------------------------------------------------------------------------------------------
+# maya.OpenMayaAnim
+# --------------------------------------------------------------------------------------------------
+
+class MFnSkinCluster(object):
+
+    def __init__(self, mobj):
+        self.name = mobj.node
+        self.skin = scene.skinClusters[self.name]
+
+    def __rows(self, components):
+        """
+        :return: numpy.ndarray, vertex indices of the components
+        """
+        if components.elements is None:
+            return np.arange(len(self.skin['offsets']) - 1, dtype=np.int64)
+        return components.elements
+
+    def influenceObjects(self, influencePaths):
+        del influencePaths[:]
+        influencePaths.extend(MDagPath(name) for name in self.skin['influences'])
+        return len(influencePaths)
+
+    def deformerSet(self):
+        return MObject(self.name)
+
+    def getWeights(self, dagPath, components, weights, numInfluences):
+        skin = self.skin
+        taken = weightUtils.takeSparseRows(skin['offsets'], skin['indices'], skin['values'], self.__rows(components))
+        dense = weightUtils.sparseToDense(taken[0], taken[1], taken[2], len(skin['influences']))
+        if type(weights) is MIntArray:
+            # getWeights(dagPath, components, influenceIndices, weights) only gets the given influences
+            weights, dense = numInfluences, dense[:, weights.asNumpy()]
+        weights.assignNumpy(dense)
+
+    def setWeights(self, dagPath, components, influenceIndices, weights, normalize, oldValues=None):
+        skin = self.skin
+        rows = self.__rows(components)
+        columns = influenceIndices.asNumpy()
+        values = weights.asNumpy().reshape(len(rows), len(columns))
+
+        # merge the given columns into the current weights of the rows
+        taken = weightUtils.takeSparseRows(skin['offsets'], skin['indices'], skin['values'], rows)
+        dense = weightUtils.sparseToDense(taken[0], taken[1], taken[2], len(skin['influences']))
+        dense[:, columns] = values
+
+        order = np.argsort(rows)
+        rowOffsets, rowIndices, rowValues = weightUtils.denseToSparse(dense[order])
+        skin['offsets'], skin['indices'], skin['values'] = weightUtils.replaceSparseRows(
+            skin['offsets'], skin['indices'], skin['values'], rows[order], rowOffsets, rowIndices, rowValues)
+
+    def getBlendWeights(self, dagPath, components, weights):
+        weights.assignNumpy(self.skin['blendWeights'][self.__rows(components)])
+
+    def setBlendWeights(self, dagPath, components, weights):
+        self.skin['blendWeights'][self.__rows(components)] = weights.asNumpy()
+
+
+class MQtUtil(object):
+
+    @staticmethod
+    def mainWindow():
+        # there is no main window, the dialogs get a stand-in parent
+        return 0
+
+
+# --------------------------------------------------------------------------------------------------
+# maya.cmds
+# --------------------------------------------------------------------------------------------------
+
+def nodeType(node):
+    return scene.nodeType(node)
+
+
+def ls(*args, **kwargs):
+    if kwargs.get('sl') or kwargs.get('selection'):
+        return []
+
+    if args:
+        nodes = args[0]
+        nodes = [nodes] if isinstance(nodes, basestring) else list(nodes)
+        nodes = [node for node in nodes if scene.nodeType(node)]
+    else:
+        nodes = list(scene.meshes.keys()) + list(scene.skinClusters.keys()) + list(scene.joints)
+
+    nodeTypes = kwargs.get('type')
+    if nodeTypes:
+        nodeTypes = [nodeTypes] if isinstance(nodeTypes, basestring) else nodeTypes
+        nodes = [node for node in nodes if scene.nodeType(node) in nodeTypes]
+
+    if kwargs.get('long'):
+        nodes = ['|%s|%s' % (scene.meshes[node]['transform'], node) if node in scene.meshes else node
+                 for node in nodes]
+    return nodes
+
+
+def listRelatives(node, **kwargs):
+    shapes = [shape for shape, mesh in scene.meshes.items() if mesh['transform'] == node]
+    return shapes or None
+
+
+def listHistory(node, **kwargs):
+    skin = scene.skinClusterOf(shortName(node))
+    return [node, skin] if skin else [node]
+
+
+def listConnections(node, **kwargs):
+    return None
+
+
+def getAttr(attribute):
+    attr = attribute.split('.', 1)[1]
+    if attr == 'intermediateObject':
+        return False
+    return scene.skinClusters[shortName(attribute)][attr]
+
+
+def setAttr(attribute, value):
+    attr = attribute.split('.', 1)[1]
+    scene.skinClusters[shortName(attribute)][attr] = value
+
+
+def polyEvaluate(shape, vertex=False, edge=False, face=False):
+    mesh = scene.meshes[shortName(shape)]
+    if vertex:
+        return len(mesh['points'])
+    if face:
+        return mesh['faces']
+    # every quad of a grid adds two edges, plus the last row and column
+    numVertices, numFaces = len(mesh['points']), mesh['faces']
+    return numVertices + numFaces - 1
+
+
+def xform(component, **kwargs):
+    return scene.meshes[shortName(component)]['points'].ravel().tolist()
+
+
+def skinCluster(*args, **kwargs):
+    if kwargs.get('q') or kwargs.get('query'):
+        if kwargs.get('geometry') or kwargs.get('g'):
+            return [scene.skinClusters[shortName(args[0])]['geometry']]
+        if kwargs.get('influence') or kwargs.get('inf'):
+            return list(scene.skinClusters[shortName(args[0])]['influences'])
+        return None
+
+    influences, shape = args[0], shortName(args[-1])
+    shape = shape if shape in scene.meshes else listRelatives(shape)[0]
+    return [scene.createSkinCluster(shape, influences, name=kwargs.get('n', kwargs.get('name')))]
+
+
+def undoInfo(*args, **kwargs):
+    if kwargs.get('q') or kwargs.get('query'):
+        return scene.undoState
+    if 'state' in kwargs:
+        scene.undoState = kwargs['state']
+
+
+def flushUndo():
+    del scene.undoQueue[:]
+    scene.undoIndex = 0
+
+
+def undo():
+    scene.undoIndex -= 1
+    scene.undoQueue[scene.undoIndex].undoIt()
+
+
+def redo():
+    scene.undoQueue[scene.undoIndex].redoIt()
+    scene.undoIndex += 1
+
+
+def pluginInfo(name, **kwargs):
+    return name in sys.modules.get('_fakeMayaPlugins', {})
+
+
+def loadPlugin(path, **kwargs):
+    # the plugin is loaded as a module of its own like Maya does
+    name = os.path.splitext(os.path.basename(path))[0]
+    plugins = sys.modules.setdefault('_fakeMayaPlugins', {})
+    plugins[name] = imp.load_source('_fakeMayaPlugin_' + name, path)
+    plugins[name].initializePlugin(MObject(name))
+    return [name]
+
+
+def delete(*nodes):
+    # only skinClusters are deleted by skinLib
+    for node in nodes:
+        scene.skinClusters.pop(shortName(node), None)
+    scene.nodeAdded()
+
+
+def workspace(*args, **kwargs):
+    return ''
+
+
+# --------------------------------------------------------------------------------------------------
+# maya.api.OpenMaya and maya.api.OpenMayaAnim
+# --------------------------------------------------------------------------------------------------
+
+class MSelectionList2(MSelectionList):
+
+    def getDependNode(self, index):
+        return MObject(self.items[index][0])
+
+    def getDagPath(self, index):
+        return MDagPath(self.items[index][0])
+
+
+class MFnSingleIndexedComponent2(MFnSingleIndexedComponent):
+
+    def addElements(self, elements):
+        self.component.elements = np.concatenate([self.component.elements, np.asarray(elements, dtype=np.int64)])
+        return self
+
+    def setCompleteData(self, numElements):
+        self.component.elements = None
+        return self
+
+    @property
+    def isComplete(self):
+        return self.component.elements is None
+
+    def getElements(self):
+        return self.component.elements.tolist()
+
+
+class MFnMesh2(MFnMesh):
+
+    @property
+    def numVertices(self):
+        return len(self.mesh['points'])
+
+
+class MPxCommand(object):
+
+    def __init__(self):
+        pass
+
+
+class MFnPlugin(object):
+
+    def __init__(self, plugin, vendor=None, version=None):
+        pass
+
+    def registerCommand(self, name, creator):
+        def runCommand(*args, **kwargs):
+            command = creator()
+            command.doIt(args)
+            if command.isUndoable() and scene.undoState:
+                # running a command drops the undone commands
+                del scene.undoQueue[scene.undoIndex:]
+                scene.undoQueue.append(command)
+                scene.undoIndex += 1
+
+        scene.commands[name] = creator
+        setattr(sys.modules['maya.cmds'], name, runCommand)
+
+    def deregisterCommand(self, name):
+        scene.commands.pop(name, None)
+        delattr(sys.modules['maya.cmds'], name)
+
+
+class MFnSkinCluster2(MFnSkinCluster):
+    """
+    the API 2.0 function set returns its arrays instead of filling the given ones
+    """
+
+    def influenceObjects(self):
+        return [MDagPath(name) for name in self.skin['influences']]
+
+    def getPathAtIndex(self, index):
+        return MDagPath(self.skin['geometry'])
+
+    def getWeights(self, dagPath, components, influences=None):
+        weights = MDoubleArray()
+        if influences is not None:
+            MFnSkinCluster.getWeights(self, dagPath, components, influences, weights)
+            return weights
+        MFnSkinCluster.getWeights(self, dagPath, components, weights, None)
+        return weights, len(self.skin['influences'])
+
+    def setWeights(self, dagPath, components, influenceIndices, weights, normalize=True, returnOldWeights=False):
+        MFnSkinCluster.setWeights(self, dagPath, components, influenceIndices, weights, normalize)
+
+    def getBlendWeights(self, dagPath, components):
+        weights = MDoubleArray()
+        MFnSkinCluster.getBlendWeights(self, dagPath, components, weights)
+        return weights
+
+
+# --------------------------------------------------------------------------------------------------
+# installing the modules
+# --------------------------------------------------------------------------------------------------
+
+kOpenMaya = [MFn, MDoubleArray, MIntArray, MScriptUtil, MObject, MDagPath, MDagPathArray, MSelectionList,
+             MFnSingleIndexedComponent, MFnSet, MFnMesh, MGlobal, MMessage, MDGMessage, MNodeMessage, MDagMessage]
+kOpenMayaAnim = [MFnSkinCluster]
+# {API 2.0 name: class}
+kOpenMaya2 = {'MFn': MFn, 'MDoubleArray': MDoubleArray, 'MIntArray': MIntArray, 'MObject': MObject,
+              'MDagPath': MDagPath, 'MSelectionList': MSelectionList2,
+              'MFnSingleIndexedComponent': MFnSingleIndexedComponent2, 'MFnMesh': MFnMesh2,
+              'MPxCommand': MPxCommand, 'MFnPlugin': MFnPlugin}
+kOpenMayaAnim2 = {'MFnSkinCluster': MFnSkinCluster2}
+kCmds = [nodeType, ls, listRelatives, listHistory, listConnections, getAttr, setAttr, polyEvaluate, xform,
+         skinCluster, delete, workspace, undoInfo, flushUndo, undo, redo, pluginInfo, loadPlugin]
+
+
+class QtStandInType(type):
+    """
+    metaclass answering any class attribute, e.g. enums like Qt.DisplayRole used as default arguments
+    """
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return QtStandIn
+
+
+class QtStandIn(object):
+    """
+    stand-in for every Qt class, skinLib subclasses them at import time and the dialogs can be
+    driven by calling their slots
+    """
+    __metaclass__ = QtStandInType
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        # signals, widgets and methods of the instances do nothing
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return QtStandIn()
+
+    def __call__(self, *args, **kwargs):
+        return None
+
+
+def createModule(name, members):
+    """
+    :param name: str, module name
+    :param members: dict, module attributes
+    :return: module
+    """
+    module = types.ModuleType(name)
+    module.__dict__.update(members)
+    sys.modules[name] = module
+    return module
+
+
+def install(withQt=None, withApi2=True):
+    """
+    Register the fake maya modules in sys.modules, before skinLib is imported
+    :param withQt: bool, also register stand-ins for PySide2 and shiboken2, None only does it
+                   when PySide2 can not be imported
+    :param withApi2: bool, also register maya.api, without it skinLib falls back to API 1.0
+    :return: Scene, the fake scene the modules work on
+    """
+    maya = createModule('maya', {})
+    maya.cmds = createModule('maya.cmds', dict((x.__name__, x) for x in kCmds))
+    maya.OpenMaya = createModule('maya.OpenMaya', dict((x.__name__, x) for x in kOpenMaya))
+    maya.OpenMayaAnim = createModule('maya.OpenMayaAnim', dict((x.__name__, x) for x in kOpenMayaAnim))
+    maya.OpenMayaUI = createModule('maya.OpenMayaUI', {'MQtUtil': MQtUtil})
+    if withApi2:
+        maya.api = createModule('maya.api', {})
+        maya.api.OpenMaya = createModule('maya.api.OpenMaya', kOpenMaya2)
+        maya.api.OpenMayaAnim = createModule('maya.api.OpenMayaAnim', kOpenMayaAnim2)
+    else:
+        for name in ['maya.api', 'maya.api.OpenMaya', 'maya.api.OpenMayaAnim']:
+            sys.modules.pop(name, None)
+
+    if withQt is None:
+        try:
+            import PySide2
+            withQt = False
+        except ImportError:
+            withQt = True
+
+    if withQt:
+        qtMembers = dict((name, QtStandIn) for name in ['Qt', 'QDialog', 'QWidget', 'QMainWindow', 'QObject',
+                                                        'QThread', 'QModelIndex', 'QAbstractListModel',
+                                                        'QAbstractTableModel', 'QStringListModel',
+                                                        'QSortFilterProxyModel', 'QListView', 'QTableView',
+                                                        'QProgressDialog', 'QTimer'])
+        qtMembers['Signal'] = lambda *args: None
+        pyside = createModule('PySide2', {})
+        for name in ['QtCore', 'QtGui', 'QtWidgets']:
+            setattr(pyside, name, createModule('PySide2.' + name, qtMembers))
+        createModule('shiboken2', {'wrapInstance': lambda *args: None})
+
+    return scene
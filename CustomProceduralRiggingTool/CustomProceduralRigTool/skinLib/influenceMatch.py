@@ -0,0 +1,160 @@
+"""
+influenceMatch @ skinLib
+
+Match imported influences to the influences of a scene without asking the user, so imports
+also work in batch. The strategies are tried in order, each influence is matched once:
+    exact       same name
+    namespace   same name without namespaces
+    suffix      same name without namespaces and without the last '_' token, e.g. L_arm_jnt -> L_arm_bnd
+    fuzzy       closest name without namespaces on the same side, see difflib
+A mapping, a dict or a json file of {imported influence: scene influence}, is applied before the strategies.
+"""
+
+import json
+import difflib
+
+kStrategies = ('exact', 'namespace', 'suffix', 'fuzzy')
+# side prefixes of the rig modules, a fuzzy match never swaps the side
+kSides = ('L_', 'R_')
+
+
+def stripNamespace(name):
+    """
+    :param name: str, influence name or dag path
+    :return: str, name without the namespace of any path token
+    """
+    return '|'.join(token.split(':')[-1] for token in name.split('|'))
+
+
+def stripSuffix(name):
+    """
+    Remove the suffix of the leaf name, like name.removeSuffix of the rig utils
+    :param name: str, influence name or dag path
+    :return: str, name without the suffix
+    """
+    path, separator, leaf = name.rpartition('|')
+    tokens = leaf.split('_')
+    if len(tokens) < 2:
+        return name
+    return path + separator + '_'.join(tokens[:-1])
+
+
+def getSide(name):
+    """
+    :param name: str, influence name or dag path
+    :return: str, side prefix of the leaf name of kSides or None
+    """
+    leaf = name.rpartition('|')[2]
+    for side in kSides:
+        if leaf.startswith(side):
+            return side
+    return None
+
+
+def loadMapping(mapping):
+    """
+    :param mapping: dict or str path of a json file with {imported influence: scene influence}
+    :return: dict
+    """
+    if not mapping:
+        return {}
+    if isinstance(mapping, basestring):
+        with open(mapping) as fh:
+            return dict(json.load(fh))
+    return dict(mapping)
+
+
+class InfluenceMatcher(object):
+    """
+    class holding the lookup tables of the scene influences, built once for any number of imported influences
+    """
+
+    def __init__(self, targets, strategies=kStrategies, fuzzyCutoff=0.8):
+        """
+        :param targets: list(str), scene influences which can receive weights
+        :param strategies: list(str), strategies of kStrategies in the order they are tried
+        :param fuzzyCutoff: float, minimum similarity ratio of a fuzzy match, from 0 to 1
+        """
+        unknown = set(strategies).difference(kStrategies)
+        if unknown:
+            raise ValueError('Unknown remap strategies %s, use %s' % (sorted(unknown), kStrategies))
+
+        self.targets = list(targets)
+        self.strategies = list(strategies)
+        self.fuzzyCutoff = fuzzyCutoff
+
+        # {key: target}, keys shared by several targets are ambiguous and removed
+        self.tables = {}
+        for strategy in ['exact', 'namespace', 'suffix']:
+            table = {}
+            ambiguous = set()
+            for target in self.targets:
+                key = self.key(strategy, target)
+                if key in table and table[key] != target:
+                    ambiguous.add(key)
+                table[key] = target
+            for key in ambiguous:
+                del table[key]
+            self.tables[strategy] = table
+
+        self.tables['fuzzy'] = self.tables['namespace']
+        # {side: keys}, fuzzy matches are only searched among the influences of the same side
+        self.fuzzyKeys = {}
+        for key in self.tables['fuzzy']:
+            self.fuzzyKeys.setdefault(getSide(key), []).append(key)
+
+    @staticmethod
+    def key(strategy, name):
+        """
+        :param strategy: str, one of kStrategies
+        :param name: str, influence name
+        :return: str, the lookup key of the name for the strategy
+        """
+        if strategy == 'exact':
+            return name
+        if strategy == 'suffix':
+            return stripSuffix(stripNamespace(name)).lower()
+        return stripNamespace(name)
+
+    def lookup(self, strategy, name):
+        """
+        :param strategy: str, one of kStrategies
+        :param name: str, imported influence
+        :return: str, the matching target or None
+        """
+        key = self.key(strategy, name)
+        if strategy != 'fuzzy':
+            return self.tables[strategy].get(key)
+
+        matches = difflib.get_close_matches(key, self.fuzzyKeys.get(getSide(key), []), n=1, cutoff=self.fuzzyCutoff)
+        return self.tables['fuzzy'][matches[0]] if matches else None
+
+    def match(self, sources, mapping=None):
+        """
+        Match the imported influences to the targets, every target receives at most one influence
+        :param sources: list(str), imported influences
+        :param mapping: dict or str json file path, explicit {imported influence: target}, targets may
+                        be given with or without namespace
+        :return: dict, {imported influence: target}, influences without a match are missing
+        """
+        result = {}
+        used = set()
+
+        targetTable = dict((stripNamespace(target), target) for target in self.targets)
+        targetTable.update((target, target) for target in self.targets)
+        for source, target in loadMapping(mapping).items():
+            target = targetTable.get(target)
+            if source in sources and target and target not in used:
+                result[source] = target
+                used.add(target)
+
+        for strategy in self.strategies:
+            for source in sources:
+                if source in result:
+                    continue
+                target = self.lookup(strategy, source)
+                if target is not None and target not in used:
+                    result[source] = target
+                    used.add(target)
+
+        return result
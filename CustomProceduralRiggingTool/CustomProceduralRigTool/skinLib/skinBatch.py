@@ -0,0 +1,304 @@
+"""
+skinBatch @ skinLib
+
+Export or import the skin weights of many scenes from the command line, every scene is processed by
+its own mayapy process and several processes run at the same time:
+    mayapy skinBatch.py export --directory skins [--processes 4] [--meshes body head] [--quantization 8]
+                               [--geometry points] scenes/*.ma
+    mayapy skinBatch.py import --directory skins [--processes 4] [--transfer barycentric]
+                               [--mapping mapping.json] [--saveDirectory reskinned] scenes/*.ma
+Every scene gets a sub directory of the skin directory named after the scene, holding the .skin files
+and the manifest written by SkinCluster.exportAll, imports read that manifest back.
+The results and timings of all the scenes and meshes are written to skinBatch.json in the skin directory.
+Imports never open the remap dialog, unmatched influences are skipped and reported.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import traceback
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+kBatchManifestName = 'skinBatch.json'
+
+
+def getMayapy():
+    """
+    Find the mayapy executable, the current interpreter if it is mayapy
+    :return: str, path of mayapy
+    """
+    if 'mayapy' in os.path.basename(sys.executable).lower():
+        return sys.executable
+
+    mayaLocation = os.environ.get('MAYA_LOCATION')
+    if mayaLocation:
+        executable = 'mayapy.exe' if sys.platform == 'win32' else 'mayapy'
+        return os.path.join(mayaLocation, 'bin', executable)
+    return 'mayapy'
+
+
+def getSceneDirectories(scenes, directory):
+    """
+    Give every scene its own sub directory, scenes with the same name get a number
+    :param scenes: list(str), scene paths
+    :param directory: str, skin directory
+    :return: list(str), directory of every scene
+    """
+    directories = []
+    names = set()
+    for scene in scenes:
+        name = baseName = os.path.splitext(os.path.basename(scene))[0]
+        count = 1
+        while name in names:
+            name = '%s%d' % (baseName, count)
+            count += 1
+        names.add(name)
+        directories.append(os.path.join(directory, name))
+
+    return directories
+
+
+def exportScene(task):
+    """
+    Export the skinned meshes of the opened scene, runs in the worker
+    :param task: dict, worker task
+    :return: dict, results of the scene
+    """
+    import skinLib
+
+    shapes = None
+    if task.get('meshes'):
+        shapes = [skinLib.getShape(mesh) for mesh in task['meshes']]
+
+    manifestPath = skinLib.SkinCluster.exportAll(task['sceneDirectory'], shapes=shapes,
+                                                 compression=task.get('compression'),
+                                                 quantization=task.get('quantization'),
+                                                 geometry=task.get('geometry', True))
+    with open(manifestPath) as fh:
+        manifest = json.load(fh)
+
+    return {'manifest': manifestPath,
+            'meshes': [{'shape': mesh['shape'], 'file': mesh['file'], 'status': 'ok'}
+                       for mesh in manifest['meshes']]}
+
+
+def importScene(task):
+    """
+    Import the .skin files of the manifest of the scene into the opened scene and save it, runs in the worker
+    :param task: dict, worker task
+    :return: dict, results of the scene
+    """
+    import maya.cmds as cmds
+    import skinLib
+
+    manifestPath = os.path.join(task['sceneDirectory'], skinLib.SkinCluster.kManifestName)
+    with open(manifestPath) as fh:
+        manifest = json.load(fh)
+
+    meshes = []
+    for mesh in manifest['meshes']:
+        if task.get('meshes') and not any(mesh['shape'].endswith(name) for name in task['meshes']):
+            continue
+
+        result = {'shape': mesh['shape'], 'file': mesh['file']}
+        start = time.time()
+        try:
+            if not cmds.objExists(mesh['shape']):
+                raise RuntimeError('%s does not exist' % mesh['shape'])
+            skinLib.SkinCluster.createAndImport(os.path.join(task['sceneDirectory'], mesh['file']), mesh['shape'],
+                                                transfer=task.get('transfer'), mapping=task.get('mapping'))
+            result['status'] = 'ok'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+        result['time'] = time.time() - start
+        meshes.append(result)
+
+    if task.get('saveDirectory'):
+        if not os.path.isdir(task['saveDirectory']):
+            os.makedirs(task['saveDirectory'])
+        cmds.file(rename=os.path.join(task['saveDirectory'], os.path.basename(task['scene'])))
+        cmds.file(save=True, force=True)
+    elif task.get('save'):
+        cmds.file(save=True, force=True)
+
+    return {'manifest': manifestPath,
+            'scene': cmds.file(q=1, sceneName=1),
+            'meshes': meshes}
+
+
+def runWorker(taskPath):
+    """
+    Entry point of the mayapy worker process, opens one scene and exports or imports its weights
+    :param taskPath: str, json file of the task, the result is written to task['resultPath']
+    :return: None
+    """
+    with open(taskPath) as fh:
+        task = json.load(fh)
+
+    result = {'scene': task['scene'], 'mode': task['mode']}
+    start = time.time()
+    standalone = None
+    try:
+        import maya.standalone as standalone
+        standalone.initialize(name='python')
+        import maya.cmds as cmds
+
+        openStart = time.time()
+        cmds.file(task['scene'], open=True, force=True)
+        result['openTime'] = time.time() - openStart
+        # nobody undoes a batch, the imports do not need to snapshot the weights
+        cmds.undoInfo(state=False)
+
+        if task['mode'] == 'export':
+            result.update(exportScene(task))
+        else:
+            result.update(importScene(task))
+
+        failed = [mesh for mesh in result['meshes'] if mesh['status'] != 'ok']
+        result['status'] = 'error' if failed else 'ok'
+    except Exception:
+        result['status'] = 'error'
+        result['error'] = traceback.format_exc()
+
+    result['time'] = time.time() - start
+    with open(task['resultPath'], 'w') as fh:
+        json.dump(result, fh, indent=4)
+
+    # exiting without uninitializing can crash mayapy after the result is written
+    if standalone is not None:
+        standalone.uninitialize()
+
+
+def runTask(task, mayapy):
+    """
+    Run one worker process and wait for its result
+    :param task: dict, worker task
+    :param mayapy: str, path of mayapy
+    :return: dict, result of the scene
+    """
+    handle, taskPath = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    task['resultPath'] = taskPath + '.result'
+    with open(taskPath, 'w') as fh:
+        json.dump(task, fh)
+
+    start = time.time()
+    try:
+        process = subprocess.Popen([mayapy, os.path.abspath(__file__), '--worker', taskPath],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+
+        if os.path.isfile(task['resultPath']):
+            with open(task['resultPath']) as fh:
+                result = json.load(fh)
+        else:
+            # the worker crashed before it could write its result
+            result = {'scene': task['scene'], 'mode': task['mode'], 'status': 'error',
+                      'error': 'mayapy exited with code %s' % process.returncode}
+        result['processTime'] = time.time() - start
+        result['log'] = output.splitlines()[-50:]
+        return result
+    finally:
+        for path in [taskPath, task['resultPath']]:
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def runBatch(mode, scenes, directory, processes=4, meshes=None, mayapy=None, **options):
+    """
+    Export or import the skin weights of the scenes on a pool of mayapy processes
+    :param mode: str, 'export' or 'import'
+    :param scenes: list(str), scene paths
+    :param directory: str, skin directory with a sub directory per scene
+    :param processes: int, number of mayapy processes running at the same time
+    :param meshes: list(str), only process these meshes of every scene, None processes all the skinned meshes
+    :param mayapy: str, path of mayapy, found by getMayapy when None
+    :param options: compression, quantization and geometry for exports, transfer, mapping, save and saveDirectory for imports
+    :return: str, path of the batch manifest
+    """
+    mayapy = mayapy or getMayapy()
+    directory = os.path.abspath(directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    tasks = []
+    for scene, sceneDirectory in zip(scenes, getSceneDirectories(scenes, directory)):
+        task = {'mode': mode,
+                'scene': os.path.abspath(scene),
+                'sceneDirectory': sceneDirectory,
+                'meshes': meshes}
+        task.update(options)
+        tasks.append(task)
+
+    start = time.time()
+    pool = ThreadPool(max(1, min(processes, len(tasks))))
+    try:
+        results = pool.map(lambda task: runTask(task, mayapy), tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    manifest = {'mode': mode,
+                'directory': directory,
+                'processes': processes,
+                'time': time.time() - start,
+                'failed': [result['scene'] for result in results if result['status'] != 'ok'],
+                'scenes': results}
+
+    manifestPath = os.path.join(directory, kBatchManifestName)
+    with open(manifestPath, 'w') as fh:
+        json.dump(manifest, fh, indent=4)
+
+    print "%s %d scenes in %.1fs, %d failed, see %s" % (mode.capitalize(), len(results), manifest['time'],
+                                                        len(manifest['failed']), manifestPath)
+    return manifestPath
+
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if arguments[:1] == ['--worker']:
+        runWorker(arguments[1])
+        return 0
+
+    parser = argparse.ArgumentParser(description='Export or import skin weights of many scenes with mayapy')
+    parser.add_argument('mode', choices=['export', 'import'])
+    parser.add_argument('scenes', nargs='+', help='maya scene files')
+    parser.add_argument('--directory', required=True, help='skin directory, one sub directory per scene')
+    parser.add_argument('--processes', type=int, default=4, help='number of mayapy processes')
+    parser.add_argument('--meshes', nargs='+', help='only process these meshes of every scene')
+    parser.add_argument('--mayapy', help='path of mayapy')
+    parser.add_argument('--compression', choices=['zlib', 'bz2'], help='export: compress the weights')
+    parser.add_argument('--quantization', type=int, choices=[8, 16], help='export: store 8 or 16 bit weights')
+    parser.add_argument('--geometry', choices=['all', 'points', 'none'], default='all',
+                        help='export: store the positions and triangles to transfer the weights, '
+                             'points is enough for nearest transfers')
+    parser.add_argument('--transfer', choices=['nearest', 'barycentric', 'auto'],
+                        help='import: map the weights by position onto edited meshes, '
+                             'auto only maps the meshes whose topology changed')
+    parser.add_argument('--mapping', help='import: json file of {imported influence: scene influence}')
+    parser.add_argument('--save', action='store_true', help='import: save the scenes in place')
+    parser.add_argument('--saveDirectory', help='import: save the scenes to this directory instead')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.mode == 'export':
+        options = {'compression': arguments.compression, 'quantization': arguments.quantization,
+                   'geometry': {'all': True, 'points': 'points', 'none': False}[arguments.geometry]}
+    else:
+        options = {'transfer': arguments.transfer,
+                   'mapping': os.path.abspath(arguments.mapping) if arguments.mapping else None,
+                   'save': arguments.save,
+                   'saveDirectory': os.path.abspath(arguments.saveDirectory) if arguments.saveDirectory else None}
+
+    manifestPath = runBatch(arguments.mode, arguments.scenes, arguments.directory, arguments.processes,
+                            arguments.meshes, arguments.mayapy, **options)
+    with open(manifestPath) as fh:
+        return 1 if json.load(fh)['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""
+skinBenchmark @ skinLib
+
+Benchmarks for the skin IO, run outside of Maya:
+    python skinBenchmark.py formats [--vertices 100000] [--influences 100]
+        file size, write and read time of every file format
+    python skinBenchmark.py skin [--vertices 10000 100000 1000000] [--influences 20 100 400]
+                                 [--blockSize N] [--output results.json]
+        wall time and peak memory of SkinCluster.gatherData, exportSkin, createAndImport and setData
+        on synthetic grid meshes, through the maya stand-in of fakeMaya
+Results are printed as json, every skin case runs in its own process so the peak memory of one case
+does not leak into the next one.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import itertools
+import cPickle as pickle
+import multiprocessing
+import numpy as np
+
+import skinFile
+import weightUtils
+
+# cases with more weights than this stream the weights in blocks when no blockSize is given,
+# a single dense matrix would not fit in memory
+kMaxDenseWeights = 40 * 1000 * 1000
+kStreamBlockSize = 65536
+
+
+def syntheticSparseWeights(numVertices, numInfluences, influencesPerVertex=4, seed=0):
+    """
+    Create normalized CSR weights with a fixed number of non zero weights per vertex,
+    neighbouring vertices use neighbouring influences like a real skeleton
+    :param numVertices: int
+    :param numInfluences: int
+    :param influencesPerVertex: int, non zero weights per vertex
+    :param seed: int, random seed
+    :return: (offsets, indices, values)
+    """
+    random = np.random.RandomState(seed)
+    influencesPerVertex = min(influencesPerVertex, numInfluences)
+
+    first = (np.arange(numVertices, dtype=np.int64) * numInfluences // max(numVertices, 1))
+    columns = np.sort((first[:, None] + np.arange(influencesPerVertex)[None, :]) % numInfluences, axis=1)
+    values = random.rand(numVertices, influencesPerVertex)
+    values /= values.sum(axis=1)[:, None]
+
+    offsets = np.arange(numVertices + 1, dtype=np.int64) * influencesPerVertex
+    return offsets, columns.astype(np.int32).ravel(), values.ravel()
+
+
+def syntheticWeights(numVertices, numInfluences, influencesPerVertex=4, seed=0):
+    """
+    Create a normalized weight matrix, see syntheticSparseWeights
+    :return: numpy.ndarray, (vertices x influences) weight matrix
+    """
+    offsets, indices, values = syntheticSparseWeights(numVertices, numInfluences, influencesPerVertex, seed)
+    return weightUtils.sparseToDense(offsets, indices, values, numInfluences)
+
+
+def timeIt(function, *args, **kwargs):
+    """
+    :return: (result, seconds)
+    """
+    start = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start
+
+
+def readStatus(field):
+    """
+    Read a memory field of /proc/self/status
+    :param field: str, e.g. 'VmRSS' or 'VmHWM'
+    :return: int, bytes or None if the field is not available
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return None
+
+
+def resetPeakMemory():
+    """
+    Reset the peak resident set size of the process, so the next measure only covers the next stage
+    :return: bool, False if the peak can not be reset on this system
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        return True
+    except IOError:
+        return False
+
+
+def peakMemory():
+    """
+    :return: int, peak resident set size in bytes since the last resetPeakMemory,
+             or since the process started if it could not be reset
+    """
+    peak = readStatus('VmHWM')
+    if peak is None:
+        # ru_maxrss is in kilobytes on linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run a stage with the output of skinLib silenced
+    :return: (result, {'time': seconds, 'peakMemory': bytes, 'memoryGrowth': bytes})
+    """
+    resetPeakMemory()
+    before = readStatus('VmRSS') or peakMemory()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        result, seconds = timeIt(function, *args, **kwargs)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    peak = peakMemory()
+    return result, {'time': seconds, 'peakMemory': peak, 'memoryGrowth': peak - before}
+
+
+def benchmarkFormats(numVertices=100000, numInfluences=100, directory=None):
+    """
+    Compare the legacy pickle with the binary format, dense, sparse and compressed
+    :param numVertices: int
+    :param numInfluences: int
+    :param directory: str, directory for the temporary files, a temporary directory is used when None
+    :return: dict, {format: {'size': bytes, 'write': seconds, 'read': seconds}}
+    """
+    weights = syntheticWeights(numVertices, numInfluences)
+    influences = ['joint%d' % ii for ii in range(numInfluences)]
+    blendWeights = np.zeros(numVertices)
+    header = {'influences': influences, 'vertexCount': numVertices}
+
+    removeDirectory = directory is None
+    directory = directory or tempfile.mkdtemp()
+    results = {}
+
+    def record(name, filePath, writeTime, readTime):
+        results[name] = {'size': os.path.getsize(filePath), 'write': writeTime, 'read': readTime}
+
+    try:
+        # version 1, pickled dict of per influence lists
+        filePath = os.path.join(directory, 'legacy.skin')
+        legacy = {'weights': dict((influences[ii], weights[:, ii].tolist()) for ii in range(numInfluences)),
+                  'blendWeights': blendWeights.tolist()}
+
+        def writePickle():
+            with open(filePath, 'wb') as fh:
+                pickle.dump(legacy, fh, pickle.HIGHEST_PROTOCOL)
+
+        writeTime = timeIt(writePickle)[1]
+        readTime = timeIt(lambda: skinFile.load(filePath).data())[1]
+        record('pickle', filePath, writeTime, readTime)
+
+        def readArrays(path):
+            data = skinFile.load(path)
+            # touch every page of every array
+            return [np.asarray(data.array(name)).sum() for name in data.header['arrays']]
+
+        offsets, indices, values = weightUtils.denseToSparse(weights)
+        layouts = {'dense': {'weights': weights, 'blendWeights': blendWeights},
+                   'sparse': {'offsets': offsets, 'indices': indices, 'values': values, 'blendWeights': blendWeights}}
+
+        for layout, arrays in layouts.items():
+            for compression in [None] + sorted(skinFile.kCompressors.keys()):
+                name = layout if compression is None else '%s-%s' % (layout, compression)
+                filePath = os.path.join(directory, name + '.skin')
+                writeTime = timeIt(skinFile.write, filePath, header, arrays, compression=compression)[1]
+                readTime = timeIt(readArrays, filePath)[1]
+                record(name, filePath, writeTime, readTime)
+
+    finally:
+        if removeDirectory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return results
+
+
+def benchmarkSkinCluster(numVertices=100000, numInfluences=100, blockSize=None, directory=None):
+    """
+    Run the SkinCluster code paths on a synthetic mesh in the fake maya scene.
+    Must run in a process which did not import the real maya modules
+    :param numVertices: int, vertices of the grid mesh
+    :param numInfluences: int, number of joints
+    :param blockSize: int, vertices per getWeights/setWeights call, None picks one from the size of the case
+    :param directory: str, directory for the temporary files, a temporary directory is used when None
+    :return: dict, {'vertices', 'influences', 'blockSize', 'fileSize', 'stages': {stage: measures}}
+    """
+    import fakeMaya
+    scene = fakeMaya.install()
+    import skinLib
+
+    if blockSize is None and numVertices * numInfluences > kMaxDenseWeights:
+        blockSize = kStreamBlockSize
+
+    scene.clear()
+    source = scene.createMesh('source', numVertices)
+    target = scene.createMesh('target', numVertices)
+    numVertices = scene.meshes[source]['points'].shape[0]
+    joints = scene.createJoints(numInfluences)
+    scene.createSkinCluster(source, joints, syntheticSparseWeights(numVertices, numInfluences), name='sourceSkin')
+
+    removeDirectory = directory is None
+    directory = directory or tempfile.mkdtemp()
+    filePath = os.path.join(directory, 'source' + skinLib.SkinCluster.kFileExtension)
+    stages = {}
+
+    try:
+        skin = skinLib.SkinCluster(source, blockSize=blockSize)
+        stages['gatherData'] = measure(skin.gatherData)[1]
+        # a fresh instance, exporting includes gathering the weights again
+        skin = skinLib.SkinCluster(source, blockSize=blockSize)
+        stages['exportSkin'] = measure(skin.exportSkin, filePath)[1]
+        del skin
+
+        # creates the skinCluster of the target and sets all its weights
+        stages['createAndImport'] = measure(skinLib.SkinCluster.createAndImport, filePath, target,
+                                            blockSize=blockSize)[1]
+
+        # sets the weights of the existing skinCluster again
+        data = skinLib.readSkinData(skinFile.load(filePath))
+        skin = skinLib.SkinCluster(target, blockSize=blockSize)
+        stages['setData'] = measure(skin.setData, data, force=True)[1]
+
+        return {'vertices': numVertices,
+                'influences': numInfluences,
+                'blockSize': blockSize,
+                'fileSize': os.path.getsize(filePath),
+                'stages': stages}
+
+    finally:
+        if removeDirectory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def runSkinCase(arguments):
+    """
+    pool entry point of one skin case
+    :param arguments: tuple, arguments of benchmarkSkinCluster
+    :return: dict, result of the case
+    """
+    return benchmarkSkinCluster(*arguments)
+
+
+def benchmarkSkinSuite(vertexCounts=(10000, 100000, 1000000), influenceCounts=(20, 100, 400), blockSize=None):
+    """
+    Run benchmarkSkinCluster for every combination of the sizes, each one in a fresh process
+    :param vertexCounts: list(int)
+    :param influenceCounts: list(int)
+    :param blockSize: int, vertices per block, None picks one per case
+    :return: list(dict), results of the cases
+    """
+    results = []
+    for numVertices, numInfluences in itertools.product(vertexCounts, influenceCounts):
+        pool = multiprocessing.Pool(1)
+        try:
+            results.append(pool.apply(runSkinCase, [(numVertices, numInfluences, blockSize)]))
+        finally:
+            pool.close()
+            pool.join()
+
+    return results
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the skin IO outside of Maya')
+    parser.add_argument('mode', choices=['formats', 'skin'])
+    parser.add_argument('--vertices', type=int, nargs='+')
+    parser.add_argument('--influences', type=int, nargs='+')
+    parser.add_argument('--blockSize', type=int)
+    parser.add_argument('--output', help='also write the json results to this file')
+    arguments = parser.parse_args(arguments)
+
+    if arguments.mode == 'formats':
+        results = benchmarkFormats((arguments.vertices or [100000])[0], (arguments.influences or [100])[0])
+    else:
+        results = benchmarkSkinSuite(arguments.vertices or (10000, 100000, 1000000),
+                                     arguments.influences or (20, 100, 400),
+                                     arguments.blockSize)
+
+    text = json.dumps(results, indent=4, sort_keys=True)
+    if arguments.output:
+        with open(arguments.output, 'w') as fh:
+            fh.write(text)
+    print text
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""
+skinFile @ skinLib
+
+Read and write .skin files.
+
+Version 2 layout:
+    magic (8 bytes) | version (uint32) | header size (uint32) | json header | padding | raw arrays
+The json header holds all the metadata and the offset, dtype and shape of every array, so the file
+can be opened through mmap, checked from the header alone and the weight pages read only when needed.
+Arrays can optionally be compressed, they are then split into blocks which are compressed and
+decompressed independently on a thread pool. Compressed arrays are read when they are first accessed.
+Files that do not start with the magic are version 1 pickles and are still loaded.
+"""
+
+import bz2
+import json
+import mmap
+import struct
+import zlib
+import cPickle as pickle
+import numpy as np
+from multiprocessing.pool import ThreadPool
+
+kMagic = 'CPRTSKIN'
+kVersion = 2
+# struct layout of the fixed part in front of the json header
+kPreamble = '<8sII'
+# every array starts on a multiple of this many bytes
+kAlignment = 16
+# compressors available for the arrays, both release the GIL so the blocks compress in parallel
+kCompressors = {'zlib': (zlib.compress, zlib.decompress),
+                'bz2': (bz2.compress, bz2.decompress)}
+# uncompressed size of a compressed block in bytes
+kCompressionBlockSize = 1 << 22
+
+
+def align(offset):
+    """
+    Round the offset up to the next array boundary
+    :param offset: int, byte offset
+    :return: int, aligned byte offset
+    """
+    return (offset + kAlignment - 1) // kAlignment * kAlignment
+
+
+def isBinary(filePath):
+    """
+    Check if the file is a binary .skin file without reading anything after the magic
+    :param filePath: str, path of the .skin file
+    :return: bool
+    """
+    with open(filePath, 'rb') as fh:
+        return fh.read(len(kMagic)) == kMagic
+
+
+def compressArray(array, compression, level=6, threads=4):
+    """
+    Compress the bytes of an array in independent blocks
+    :param array: numpy.ndarray, contiguous array
+    :param compression: str, key of kCompressors
+    :param level: int, compression level
+    :param threads: int, number of compression threads
+    :return: list(str), compressed blocks in order
+    """
+    compress = kCompressors[compression][0]
+    raw = array.view(np.uint8).ravel()
+    blocks = [raw[start:start + kCompressionBlockSize].tostring()
+              for start in xrange(0, raw.size, kCompressionBlockSize)]
+
+    if len(blocks) < 2 or threads < 2:
+        return [compress(block, level) for block in blocks]
+
+    pool = ThreadPool(min(threads, len(blocks)))
+    try:
+        return pool.map(lambda block: compress(block, level), blocks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def write(filePath, header, arrays, compression=None, level=6, threads=4):
+    """
+    Write the header and the arrays to disk in the binary layout
+    :param filePath: str, path of the .skin file
+    :param header: dict, json serializable metadata
+    :param arrays: dict, {name: numpy.ndarray} raw arrays stored after the header
+    :param compression: str, key of kCompressors to compress the arrays, None stores them raw so they can be mapped
+    :param level: int, compression level
+    :param threads: int, number of compression threads
+    :return: None
+    """
+    header = dict(header)
+    header['arrays'] = {}
+    names = sorted(arrays.keys())
+    arrays = dict((name, np.ascontiguousarray(arrays[name])) for name in names)
+
+    if compression is not None and compression not in kCompressors:
+        raise ValueError('Unknown compression %s, use one of %s' % (compression, sorted(kCompressors.keys())))
+
+    # array offsets are relative to the first aligned byte after the json header
+    offset = 0
+    compressedBlocks = {}
+    for name in names:
+        array = arrays[name]
+        info = {'offset': offset,
+                'dtype': array.dtype.str,
+                'shape': list(array.shape)}
+
+        if compression:
+            compressedBlocks[name] = compressArray(array, compression, level, threads)
+            info['compression'] = compression
+            info['blocks'] = [len(block) for block in compressedBlocks[name]]
+            offset = align(offset + sum(info['blocks']))
+        else:
+            offset = align(offset + array.nbytes)
+
+        header['arrays'][name] = info
+
+    headerBytes = json.dumps(header, sort_keys=True)
+    dataStart = align(struct.calcsize(kPreamble) + len(headerBytes))
+
+    with open(filePath, 'wb') as fh:
+        fh.write(struct.pack(kPreamble, kMagic, kVersion, len(headerBytes)))
+        fh.write(headerBytes)
+        for name in names:
+            fh.seek(dataStart + header['arrays'][name]['offset'])
+            if name in compressedBlocks:
+                for block in compressedBlocks[name]:
+                    fh.write(block)
+            else:
+                arrays[name].tofile(fh)
+
+
+class SkinFile(object):
+    """
+    class for reading a .skin file, the arrays are mapped lazily so only the header is read on open
+    """
+
+    def __init__(self, filePath, threads=4):
+        """
+        open the .skin file and read its header
+        :param filePath: str, path of the .skin file
+        :param threads: int, number of threads used to decompress compressed arrays
+        """
+        self.filePath = filePath
+        self.threads = threads
+        self.map = None
+        self.legacyData = None
+        # decompressed arrays, raw arrays are views of the map and are not cached
+        self.cache = {}
+
+        with open(filePath, 'rb') as fh:
+            if fh.read(len(kMagic)) != kMagic:
+                # version 1, the whole pickle needs to be loaded
+                fh.seek(0)
+                self.legacyData = pickle.load(fh)
+                self.version = 1
+                self.header = self.__legacyHeader()
+                return
+
+            fh.seek(0)
+            # mapping the file does not read it, pages are loaded when the arrays are accessed
+            self.map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, headerSize = struct.unpack_from(kPreamble, self.map, 0)
+        if self.version > kVersion:
+            raise RuntimeError('%s was written by a newer version (%d > %d)' % (filePath, self.version, kVersion))
+
+        start = struct.calcsize(kPreamble)
+        self.header = json.loads(self.map[start:start + headerSize])
+        self.dataStart = align(start + headerSize)
+
+    def __legacyHeader(self):
+        """
+        build a header from a version 1 pickle
+        :return: dict, header
+        """
+        data = self.legacyData
+        if isinstance(data['weights'], dict):
+            influences = list(data['weights'].keys())
+        else:
+            influences = list(data['influences'])
+
+        return {'name': data.get('name'),
+                'influences': influences,
+                'vertexCount': len(data['blendWeights']),
+                'skinningMethod': data.get('skinningMethod'),
+                'normalizeWeights': data.get('normalizeWeights'),
+                'fingerprint': data.get('fingerprint'),
+                'arrays': {}}
+
+    def hasArray(self, name):
+        """
+        :param name: str, array name
+        :return: bool, True if the array is stored in the file
+        """
+        return name in self.header['arrays']
+
+    def array(self, name):
+        """
+        Get a read only view of an array, no data is copied unless the array is compressed
+        :param name: str, array name
+        :return: numpy.ndarray backed by the memory map
+        """
+        info = self.header['arrays'][name]
+        dtype = np.dtype(str(info['dtype']))
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        if not count:
+            return np.zeros(shape, dtype=dtype)
+
+        if info.get('compression'):
+            if name not in self.cache:
+                self.cache[name] = self.__decompress(info, dtype, count).reshape(shape)
+            return self.cache[name]
+
+        array = np.frombuffer(self.map, dtype=dtype, count=count, offset=self.dataStart + info['offset'])
+        return array.reshape(shape)
+
+    def __decompress(self, info, dtype, count):
+        """
+        Decompress the blocks of an array in parallel
+        :param info: dict, array info from the header
+        :param dtype: numpy.dtype, array dtype
+        :param count: int, number of elements
+        :return: numpy.ndarray, 1D array
+        """
+        decompress = kCompressors[info['compression']][1]
+        start = self.dataStart + info['offset']
+        ranges = []
+        for size in info['blocks']:
+            ranges.append((start, start + size))
+            start += size
+
+        def decompressBlock(blockRange):
+            return decompress(self.map[blockRange[0]:blockRange[1]])
+
+        if len(ranges) < 2 or self.threads < 2:
+            blocks = [decompressBlock(x) for x in ranges]
+        else:
+            pool = ThreadPool(min(self.threads, len(ranges)))
+            try:
+                blocks = pool.map(decompressBlock, ranges)
+            finally:
+                pool.close()
+                pool.join()
+
+        array = np.empty(count, dtype=dtype)
+        raw = array.view(np.uint8)
+        position = 0
+        for block in blocks:
+            raw[position:position + len(block)] = np.frombuffer(block, dtype=np.uint8)
+            position += len(block)
+
+        return array
+
+    def data(self):
+        """
+        Get the skin data in the SkinCluster.data layout
+        :return: dict
+        """
+        if self.legacyData is not None:
+            return self.legacyData
+
+        data = dict((key, value) for key, value in self.header.items() if key != 'arrays')
+        for name in self.header['arrays']:
+            data[name] = self.array(name)
+
+        return data
+
+
+def load(filePath, threads=4):
+    """
+    Open a .skin file of any version
+    :param filePath: str, path of the .skin file
+    :param threads: int, number of threads used to decompress compressed arrays
+    :return: SkinFile
+    """
+    return SkinFile(filePath, threads=threads)
@@ -1,15 +1,39 @@
 import os
-import cPickle as pickle
+import sys
+import json
+import zlib
+import hashlib
+import threading
+import weakref
+import collections
+import numpy as np
 import maya.cmds as cmds
 import maya.OpenMaya as openmaya
 import maya.OpenMayaUI as openmayaui
 import maya.OpenMayaAnim as openmayaanim
 from functools import partial
+from multiprocessing.pool import ThreadPool
+import skinFile
+import spatialIndex
+import influenceMatch
+import weightUtils
 
 
 from PySide2 import QtGui, QtWidgets, QtCore
 from shiboken2 import wrapInstance
 
+try:
+    import maya.api.OpenMaya as openmaya2
+    import maya.api.OpenMayaAnim as openmayaanim2
+    import skinUndo
+except ImportError:
+    # Maya versions without the python API 2.0 skinCluster fall back to API 1.0 and can not undo imports
+    openmaya2 = openmayaanim2 = skinUndo = None
+
+# weak references to the WeightSnapshots of the undo queue, oldest first. The skinLibUndo commands own the
+# snapshots, they are freed with the commands when Maya flushes its undo queue
+undoSnapshots = collections.deque()
+
 
 def show():
     """
@@ -29,10 +53,79 @@ def getMayaWindow():
     return wrapInstance(long(ptr), QtWidgets.QMainWindow)
 
 
+class LookupCache(object):
+    """
+    class for caching the shape and skinCluster lookups of batch operations.
+    The cache is only used inside a with block and is cleared by DG callbacks whenever
+    a node is added, removed, renamed, reparented or a connection changes
+    """
+
+    def __init__(self):
+        self.shapes = {}
+        self.skinClusters = {}
+        self.callbackIds = []
+        # nested with blocks share one set of callbacks
+        self.depth = 0
+
+    def __enter__(self):
+        if not self.depth:
+            self.clear()
+            self.callbackIds = [openmaya.MDGMessage.addNodeAddedCallback(self.clear, 'dependNode'),
+                                openmaya.MDGMessage.addNodeRemovedCallback(self.clear, 'dependNode'),
+                                openmaya.MDGMessage.addConnectionCallback(self.clear),
+                                openmaya.MNodeMessage.addNameChangedCallback(openmaya.MObject(), self.clear),
+                                openmaya.MDagMessage.addAllDagChangesCallback(self.clear)]
+        self.depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self.depth -= 1
+        if not self.depth:
+            for callbackId in self.callbackIds:
+                openmaya.MMessage.removeCallback(callbackId)
+            self.callbackIds = []
+            self.clear()
+
+    def isActive(self):
+        """
+        :return: bool, True inside a with block
+        """
+        return self.depth > 0
+
+    def clear(self, *args):
+        """
+        Forget all the lookups, the arguments of the DG callbacks are ignored
+        :return: None
+        """
+        self.shapes.clear()
+        self.skinClusters.clear()
+
+
+# the cache used by getShape and SkinCluster.getSkinCluster, activate it with "with lookupCache:"
+lookupCache = LookupCache()
+
+
 def getShape(node, intermediate=False):
     """
     Get the shape from specified node.
 
+    :param node: node Name of a transform or shape node.
+    :param intermediate: intermediate True to get the intermediate shape, False to get the visible shape
+    :return: the name of the desired shape node
+    """
+    if not lookupCache.isActive():
+        return findShape(node, intermediate)
+
+    key = (node, intermediate)
+    if key not in lookupCache.shapes:
+        lookupCache.shapes[key] = findShape(node, intermediate)
+    return lookupCache.shapes[key]
+
+
+def findShape(node, intermediate=False):
+    """
+    Find the shape from specified node without the lookup cache.
+
     :param node: node Name of a transform or shape node.
     :param intermediate: intermediate True to get the intermediate shape, False to get the visible shape
     :return: the name of the desired shape node
@@ -61,28 +154,1154 @@ def getShape(node, intermediate=False):
     elif cmds.nodeType(node) in ['mesh', 'nurbsCurve', 'nurbsSurface']:
         return node
 
-    return None
+    return None
+
+
+def toNumpy(mArray, dtype=np.float64):
+    """
+    Copy an MDoubleArray or MIntArray into a contiguous numpy array
+    :param mArray: MDoubleArray or MIntArray
+    :param dtype: numpy dtype of the result
+    :return: numpy.ndarray, 1D array with the same length as mArray
+    """
+    return np.fromiter(mArray, dtype=dtype, count=mArray.length())
+
+
+def toMDoubleArray(array):
+    """
+    Copy a numpy array into an MDoubleArray in one call instead of setting every element.
+    The values pass through a python list, pass blocks of SkinCluster.kSetBlockSize vertices to bound the memory
+    :param array: numpy.ndarray, any shape, it will be flattened in C order
+    :return: MDoubleArray
+    """
+    array = np.ascontiguousarray(array, dtype=np.float64).ravel()
+    util = openmaya.MScriptUtil()
+    util.createFromList(array.tolist(), array.size)
+    return openmaya.MDoubleArray(util.asDoublePtr(), array.size)
+
+
+def toMIntArray(array):
+    """
+    Copy a numpy array into an MIntArray in one call
+    :param array: numpy.ndarray, 1D integer array
+    :return: MIntArray
+    """
+    array = np.ascontiguousarray(array, dtype=np.int64).ravel()
+    util = openmaya.MScriptUtil()
+    util.createFromList(array.tolist(), array.size)
+    return openmaya.MIntArray(util.asIntPtr(), array.size)
+
+
+def createVertexComponent(vertices):
+    """
+    Create a mesh vertex component holding the given vertex indices
+    :param vertices: numpy.ndarray, vertex indices
+    :return: MObject, component
+    """
+    fnComponent = openmaya.MFnSingleIndexedComponent()
+    component = fnComponent.create(openmaya.MFn.kMeshVertComponent)
+    fnComponent.addElements(toMIntArray(vertices))
+    return component
+
+
+def upgradeData(data):
+    """
+    Convert skin data exported by older versions, where data['weights'] is a dictionary of
+    {influence: [weight per vertex]} lists, to the (vertices x influences) weight matrix layout
+    :param data: dict, skin data loaded from a .skin file
+    :return: dict, skin data with 'influences', 'weights' and 'blendWeights' as arrays
+    """
+    if isinstance(data.get('weights'), dict):
+        influences = list(data['weights'].keys())
+        numVertices = len(data['blendWeights'])
+        weights = np.empty((numVertices, len(influences)), dtype=np.float64)
+        for ii, influence in enumerate(influences):
+            weights[:, ii] = data['weights'][influence]
+        data['influences'] = influences
+        data['weights'] = weights
+
+    if 'vertexCount' not in data:
+        data['vertexCount'] = len(data['blendWeights'])
+    if 'blendWeights' in data:
+        data['blendWeights'] = np.asarray(data['blendWeights'], dtype=np.float64)
+    return data
+
+
+def getSparseWeights(data):
+    """
+    Get the weights of skin data as CSR arrays whatever layout they are stored in
+    :param data: dict, skin data
+    :return: (offsets, indices, values)
+    """
+    if 'values' in data:
+        return data['offsets'], data['indices'], data['values']
+    return weightUtils.denseToSparse(data['weights'])
+
+
+def getContentHash(data, blockHashes):
+    """
+    Hash everything a skinCluster import would change: the influences, the vertex count,
+    the skinningMethod, normalizeWeights and the block hashes of the weights
+    :param data: dict, skin data or .skin header
+    :param blockHashes: list(str), weightUtils.blockHashes of the weights
+    :return: str, hex digest
+    """
+    md5 = hashlib.md5()
+    md5.update(json.dumps([list(data['influences']), data['vertexCount'],
+                           data['skinningMethod'], data['normalizeWeights'], list(blockHashes)]))
+    return md5.hexdigest()
+
+
+def matchFingerprint(stored, current):
+    """
+    :param stored: dict, fingerprint of a .skin file, see SkinCluster.getGeometryFingerprint,
+                   files written before the topology hash only hold the vertex, edge and face counts
+    :param current: dict, fingerprint of the shape
+    :return: bool, True if the file was exported from this topology
+    """
+    return all(current.get(key) == value for key, value in stored.items())
+
+
+def matchFileOptions(header, filePath, sparse, compression, baseline, quantization):
+    """
+    Check if an existing .skin file was written with the requested options, a file holding the same weights
+    is only skipped then
+    :param header: dict, header of the existing file
+    :param filePath: str, path of the existing file
+    :param sparse: bool, the weights are requested as CSR arrays
+    :param compression: str, requested compression, None for raw arrays
+    :param baseline: str, requested baseline file, None for a full file
+    :param quantization: int, requested quantization, None for doubles
+    :return: bool
+    """
+    if header.get('quantization') != quantization:
+        return False
+
+    arrays = header.get('arrays', {})
+    if any(info.get('compression') != compression for info in arrays.values()):
+        return False
+
+    if header.get('base') or baseline:
+        if not header.get('base') or not baseline:
+            return False
+        basePath = header['base']
+        if not os.path.isabs(basePath):
+            basePath = os.path.join(os.path.dirname(os.path.abspath(filePath)), basePath)
+        return os.path.realpath(basePath) == os.path.realpath(baseline)
+
+    # a delta file always stores sparse rows
+    return ('values' in arrays) == bool(sparse)
+
+
+def dequantizeSkinData(data):
+    """
+    Convert the quantized weights of a file written with quantization back to float weights
+    :param data: dict, skin data read from a .skin file
+    :return: dict, the same data with float64 'values', int32 'indices' and int64 'offsets'
+    """
+    if 'counts' in data:
+        data['offsets'] = weightUtils.expandCounts(data.pop('counts'))
+    if data.pop('quantization', None):
+        data['values'] = weightUtils.dequantize(data['values'])
+        data['indices'] = data['indices'].astype(np.int32)
+    return data
+
+
+def writeSkinFile(filePath, data, sparse=True, compression=None, baseline=None, force=False, quantization=None,
+                  log=None):
+    """
+    Convert gathered skin data to the file arrays and write them, only touches numpy and the file
+    so it can run on a worker thread while Maya is queried on the main thread
+    :param filePath: str, path of the .skin file
+    :param data: dict, SkinCluster.data after gatherData
+    :param sparse: bool, store only the non zero weights in CSR arrays instead of the dense matrix
+    :param compression: str, 'zlib' or 'bz2' to compress the arrays, None writes them raw
+    :param baseline: str, path of a previous .skin file of the same mesh, only the vertex blocks which
+                     changed since the baseline are written and the file refers to the baseline
+    :param force: bool, write the file even if it already holds exactly these weights
+    :param quantization: int, 8 or 16 to store the weights as uint8 or uint16 with sum preserving rounding,
+                         like the engine does, the weights are always stored sparse then. None stores doubles
+    :param log: callable receiving the messages, they are printed when None, see SkinJob.log
+    :return: int, number of vertices written, None when the file already holds these weights with these options
+    """
+    if baseline and os.path.realpath(baseline) == os.path.realpath(filePath):
+        # the delta would replace the file it is based on
+        raise ValueError('The baseline of %s can not be the file itself' % filePath)
+
+    header = {'name': data['name'],
+              'influences': data['influences'],
+              'vertexCount': data['vertexCount'],
+              'skinningMethod': data['skinningMethod'],
+              'normalizeWeights': data['normalizeWeights'],
+              'fingerprint': data['fingerprint']}
+
+    # the block hashes are stored in every file so the next export can find the changed blocks from the header
+    offsets, indices, values = getSparseWeights(data)
+    # the stored arrays, quantized weights are hashed as they will be imported
+    storedIndices, storedValues = indices, values
+    if quantization:
+        offsets, indices, storedValues = weightUtils.quantizeSparse(offsets, indices, values, quantization)
+        values = weightUtils.dequantize(storedValues)
+        storedIndices = weightUtils.compactIndices(indices, len(data['influences']))
+        header['quantization'] = quantization
+        sparse = True
+
+    header['hashBlockSize'] = SkinCluster.kHashBlockSize
+    header['blockHashes'] = weightUtils.blockHashes(offsets, indices, values, data.get('blendWeights'),
+                                                    SkinCluster.kHashBlockSize)
+    header['contentHash'] = getContentHash(header, header['blockHashes'])
+    if 'meshVertexCount' in data:
+        header['meshVertexCount'] = data['meshVertexCount']
+
+    # skip rewriting a file which already holds these weights, only its header is read
+    if not force and os.path.isfile(filePath) and skinFile.isBinary(filePath):
+        existing = skinFile.load(filePath).header
+        if (existing.get('contentHash') == header['contentHash'] and
+                matchFileOptions(existing, filePath, sparse, compression, baseline, header.get('quantization'))):
+            return None
+
+    if baseline:
+        baseHeader = skinFile.load(baseline).header
+        if (baseHeader.get('hashBlockSize') != header['hashBlockSize'] or
+                baseHeader.get('quantization') != header.get('quantization') or
+                list(baseHeader['influences']) != list(header['influences']) or
+                baseHeader['vertexCount'] != header['vertexCount']):
+            message = "%s does not match the skinCluster, writing all the weights" % baseline
+            if log:
+                log(message)
+            else:
+                print message
+        else:
+            blockSize = header['hashBlockSize']
+            changed = [ii for ii, (new, old) in enumerate(zip(header['blockHashes'], baseHeader['blockHashes']))
+                       if new != old]
+            rows = [np.arange(ii * blockSize, min((ii + 1) * blockSize, header['vertexCount'])) for ii in changed]
+            rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+
+            rowOffsets, rowIndices, rowValues = weightUtils.takeSparseRows(offsets, storedIndices, storedValues, rows)
+            arrays = {'rows': rows, 'offsets': rowOffsets, 'indices': rowIndices, 'values': rowValues}
+            if quantization:
+                arrays['counts'] = weightUtils.compactOffsets(arrays.pop('offsets'))
+            if 'blendWeights' in data:
+                arrays['blendWeights'] = data['blendWeights'][rows]
+
+            try:
+                header['base'] = os.path.relpath(baseline, os.path.dirname(os.path.abspath(filePath)))
+            except ValueError:
+                # different drive on windows
+                header['base'] = os.path.abspath(baseline)
+
+            skinFile.write(filePath, header, arrays, compression=compression)
+            return len(rows)
+
+    if quantization:
+        # the rows of quantized weights are short, their lengths fit in a byte
+        arrays = {'counts': weightUtils.compactOffsets(offsets), 'indices': storedIndices, 'values': storedValues}
+    elif sparse:
+        arrays = {'offsets': offsets, 'indices': storedIndices, 'values': storedValues}
+    elif 'values' in data:
+        arrays = {'weights': weightUtils.sparseToDense(offsets, indices, values, len(data['influences']))}
+    else:
+        arrays = {'weights': data['weights']}
+
+    if 'blendWeights' in data:
+        arrays['blendWeights'] = data['blendWeights']
+
+    # the geometry is stored to transfer the weights to a mesh with another topology
+    for key in ['points', 'triangles', 'vertexIndices']:
+        if key in data:
+            arrays[key] = data[key]
+
+    skinFile.write(filePath, header, arrays, compression=compression)
+    return header['vertexCount']
+
+
+def readSkinData(skinData, visited=None):
+    """
+    Get the skin data of an opened .skin file. A delta file is applied on top of its chain of base files
+    :param skinData: skinFile.SkinFile
+    :param visited: set(str), real paths of the files further down the chain, used to detect cycles
+    :return: dict, skin data in the SkinCluster.data layout
+    """
+    if not skinData.header.get('base'):
+        return dequantizeSkinData(upgradeData(skinData.data()))
+
+    visited = set(visited or [])
+    visited.add(os.path.realpath(skinData.filePath))
+
+    basePath = skinData.header['base']
+    if not os.path.isabs(basePath):
+        basePath = os.path.join(os.path.dirname(os.path.abspath(skinData.filePath)), basePath)
+    if os.path.realpath(basePath) in visited:
+        raise RuntimeError('The base files of %s form a cycle at %s' % (skinData.filePath, basePath))
+    base = readSkinData(skinFile.load(basePath), visited)
+
+    delta = dequantizeSkinData(skinData.data())
+    rows = delta.pop('rows')
+    offsets, indices, values = getSparseWeights(base)
+    offsets, indices, values = weightUtils.replaceSparseRows(offsets, indices, values, rows,
+                                                             delta.pop('offsets'), delta.pop('indices'),
+                                                             delta.pop('values'))
+
+    data = delta
+    data['offsets'] = offsets
+    data['indices'] = indices
+    data['values'] = values
+    if 'blendWeights' in delta:
+        blendWeights = np.array(base['blendWeights'], dtype=np.float64)
+        blendWeights[rows] = delta['blendWeights']
+        data['blendWeights'] = blendWeights
+
+    # deltas do not store the geometry
+    for key in ['points', 'triangles', 'vertexIndices']:
+        if key in base:
+            data[key] = base[key]
+
+    return data
+
+
+def transferSkinData(data, points, mode='barycentric', index=None):
+    """
+    Map skin data onto a mesh with another topology through the vertex positions stored in the data
+    :param data: dict, skin data with 'points' and, for the barycentric mode, 'triangles'
+    :param points: numpy.ndarray, (vertices x 3) world positions of the target mesh
+    :param mode: str, 'nearest' copies the weights of the nearest source vertex,
+                 'barycentric' interpolates the weights of the closest source triangle
+    :param index: spatialIndex.SurfaceIndex of the data points, pass it to transfer the same data to many meshes
+    :return: dict, skin data with one CSR row per target vertex, the region of a region file is not kept
+    """
+    if 'points' not in data:
+        raise RuntimeError('The skin data has no vertex positions, export it again to transfer the weights')
+    if mode not in ['nearest', 'barycentric']:
+        raise ValueError('Unknown transfer mode %s' % mode)
+
+    if index is None:
+        index = spatialIndex.SurfaceIndex(data['points'], data.get('triangles') if mode == 'barycentric' else None)
+    rows, factors = index.closest(points, mode)
+
+    offsets, indices, values = getSparseWeights(data)
+
+    result = dict((key, value) for key, value in data.items()
+                  if key not in ['weights', 'points', 'triangles', 'contentHash', 'blockHashes', 'fingerprint',
+                                 'vertexIndices', 'meshVertexCount'])
+    offsets, indices, values = weightUtils.blendSparseRows(offsets, indices, values, rows, factors,
+                                                           len(data['influences']))
+    result['offsets'] = offsets
+    result['indices'] = indices
+    result['values'] = values
+    result['vertexCount'] = len(points)
+
+    if 'blendWeights' in data:
+        result['blendWeights'] = (np.asarray(data['blendWeights'])[rows] * factors).sum(axis=1)
+
+    return result
+
+
+def cleanSkinData(data, pruneBelow=0.0, maxInfluences=None):
+    """
+    Remove weights below pruneBelow, keep the maxInfluences largest weights per vertex and renormalize,
+    so the weights which reach the engine stay within its influence budget
+    :param data: dict, skin data
+    :param pruneBelow: float, weights smaller than this are removed, except the largest weight of a vertex
+    :param maxInfluences: int, maximum number of influences per vertex, None keeps them all
+    :return: (dict cleaned skin data, int number of changed vertices)
+    """
+    offsets, indices, values, changed = weightUtils.cleanSparse(*getSparseWeights(data), pruneBelow=pruneBelow,
+                                                                maxInfluences=maxInfluences)
+    numChanged = int(np.count_nonzero(changed))
+
+    result = dict((key, value) for key, value in data.items() if key != 'weights')
+    result['offsets'] = offsets
+    result['indices'] = indices
+    result['values'] = values
+    if numChanged:
+        # the weights are not the ones of the file anymore
+        result.pop('contentHash', None)
+
+    return result, numChanged
+
+
+def selectSkinRows(data, vertices):
+    """
+    Restrict skin data to a region of the mesh
+    :param data: dict, skin data of the whole mesh or of a region with 'vertexIndices'
+    :param vertices: list(int), mesh vertex indices of the region,
+                     vertices which are not in a region file are skipped
+    :return: dict, skin data of the region with 'vertexIndices'
+    """
+    vertices = np.unique(np.asarray(vertices, dtype=np.int64))
+
+    if 'vertexIndices' in data:
+        stored = np.asarray(data['vertexIndices'], dtype=np.int64)
+        rows = np.searchsorted(stored, vertices)
+        rows[rows == len(stored)] = 0
+        found = stored[rows] == vertices
+        rows, vertices = rows[found], vertices[found]
+    else:
+        rows = vertices
+
+    result = dict((key, value) for key, value in data.items()
+                  if key not in ['weights', 'offsets', 'indices', 'values', 'points', 'triangles', 'contentHash'])
+    if 'values' in data:
+        offsets, indices, values = weightUtils.takeSparseRows(data['offsets'], data['indices'], data['values'], rows)
+        result['offsets'] = offsets
+        result['indices'] = indices
+        result['values'] = values
+    else:
+        result['weights'] = np.asarray(data['weights'])[rows]
+
+    if 'blendWeights' in data:
+        result['blendWeights'] = np.asarray(data['blendWeights'])[rows]
+
+    result['vertexIndices'] = vertices
+    result['vertexCount'] = len(vertices)
+    return result
+
+
+def mirrorInfluences(influences, sides=('L_', 'R_')):
+    """
+    Build the column permutation which swaps the influences of both sides, influences without
+    a side prefix or without a partner keep their column
+    :param influences: list(str), influence names without namespace
+    :param sides: (str, str), prefixes of both sides, as the rig modules name them
+    :return: (numpy.ndarray int64 mirrored column of every column, list(str) influences missing their partner)
+    """
+    table = dict((name, ii) for ii, name in enumerate(influences))
+    permutation = np.arange(len(influences), dtype=np.int64)
+    missing = []
+
+    for ii, name in enumerate(influences):
+        # only the leaf of a dag path carries the side
+        path, separator, leaf = name.rpartition('|')
+        for side, otherSide in [sides, sides[::-1]]:
+            if leaf.startswith(side):
+                partner = path + separator + otherSide + leaf[len(side):]
+                if partner in table:
+                    permutation[ii] = table[partner]
+                else:
+                    missing.append(name)
+                break
+
+    return permutation, missing
+
+
+def mirrorSkinData(data, axis='x', positive=True, sides=('L_', 'R_'), tolerance=None, centerTolerance=1e-3):
+    """
+    Mirror the weights of one side of the mesh onto the other side. The mirror partner of every vertex
+    is found with one spatial hash query and the side influences are swapped through a column permutation
+    :param data: dict, skin data of the whole mesh with 'points'
+    :param axis: str, 'x', 'y' or 'z', normal of the mirror plane through the origin
+    :param positive: bool, copy the weights from the positive side to the negative side
+    :param sides: (str, str), prefixes of the influences of both sides
+    :param tolerance: float, vertices whose partner is further than this are not mirrored, None always
+                      uses the nearest vertex
+    :param centerTolerance: float, vertices this close to the mirror plane keep their weights
+    :return: (dict skin data of the mirrored vertices with 'vertexIndices', int number of vertices
+              without a partner within the tolerance)
+    """
+    if 'points' not in data:
+        raise RuntimeError('The skin data has no vertex positions, gather it with the geometry to mirror it')
+    if 'vertexIndices' in data:
+        raise RuntimeError('Only the skin data of a whole mesh can be mirrored')
+
+    points = np.asarray(data['points'], dtype=np.float64)
+    axisIndex = 'xyz'.index(axis)
+
+    # vertices of the destination side, they get the weights of their mirror partner
+    side = points[:, axisIndex] if positive else -points[:, axisIndex]
+    vertices = np.nonzero(side < -centerTolerance)[0]
+    mirrored = points[vertices]
+    mirrored[:, axisIndex] *= -1.0
+
+    partners, distances = spatialIndex.SpatialHash(points).nearest(mirrored)
+    numUnmatched = 0
+    if tolerance is not None:
+        matched = distances <= tolerance
+        numUnmatched = len(vertices) - int(np.count_nonzero(matched))
+        vertices, partners = vertices[matched], partners[matched]
+
+    permutation, missing = mirrorInfluences(data['influences'], sides)
+    if missing:
+        print "No mirrored influence for %s, their weights are not swapped" % ', '.join(missing)
+
+    offsets, indices, values = weightUtils.takeSparseRows(*getSparseWeights(data), rows=partners)
+
+    result = dict((key, value) for key, value in data.items()
+                  if key not in ['weights', 'points', 'triangles', 'contentHash', 'blockHashes', 'fingerprint'])
+    result['offsets'] = offsets
+    result['indices'] = permutation[indices].astype(np.int32)
+    result['values'] = values
+    if 'blendWeights' in data:
+        result['blendWeights'] = np.asarray(data['blendWeights'])[partners]
+
+    result['vertexIndices'] = vertices
+    result['vertexCount'] = len(vertices)
+    return result, numUnmatched
+
+
+def getSkinReport(source=None, maxInfluences=None, tolerance=1e-4):
+    """
+    Get the statistics of the weights of a skinCluster or of a .skin file, see weightUtils.sparseStatistics
+    :param source: str, .skin file path or a shape with a skinCluster, the selected shape when None
+    :param maxInfluences: int, influences per vertex the engine supports, SkinCluster.kEngineMaxInfluences when None
+    :param tolerance: float, largest accepted difference of the weights sum of a vertex to 1
+    :return: dict, the statistics with 'name', 'source', 'influences', 'maxInfluences' and 'tolerance',
+             'unusedInfluences' holds influence names
+    """
+    maxInfluences = maxInfluences or SkinCluster.kEngineMaxInfluences
+    if source and os.path.isfile(source):
+        data = readSkinData(skinFile.load(source))
+    else:
+        # streamed in blocks so the dense matrix of the whole mesh is never built
+        skin = SkinCluster(source, blockSize=SkinCluster.kAsyncBlockSize)
+        skin.gatherData(geometry=False)
+        data = skin.data
+        source = skin.shape
+
+    offsets, indices, values = getSparseWeights(data)
+    report = weightUtils.sparseStatistics(offsets, indices, values, len(data['influences']), maxInfluences,
+                                          tolerance)
+    report['unusedInfluences'] = [data['influences'][ii] for ii in report['unusedInfluences']]
+    report.update({'name': data['name'],
+                   'source': source,
+                   'influences': list(data['influences']),
+                   'maxInfluences': maxInfluences,
+                   'tolerance': tolerance})
+    return report
+
+
+def formatSkinReport(report, numInfluences=10):
+    """
+    :param report: dict, see getSkinReport
+    :param numInfluences: int, number of the heaviest influences listed
+    :return: str, the report as text
+    """
+    histogram = report['influencesPerVertex']
+    lines = ['%s (%s)' % (report['name'], report['source']),
+             '%d vertices, %d influences' % (report['vertexCount'], len(report['influences'])),
+             '',
+             'Influences per vertex:']
+    lines.extend('    %2d: %d vertices' % (count, histogram[count]) for count in xrange(len(histogram))
+                 if histogram[count])
+    lines.append('Vertices over %d influences: %d' % (report['maxInfluences'], report['verticesOverCap']))
+    lines.append('Vertices not normalized (> %g): %d, max error %g' % (report['tolerance'],
+                                                                     report['unnormalizedVertices'],
+                                                                     report['maxNormalizationError']))
+    lines.append('Unused influences: %d %s' % (len(report['unusedInfluences']),
+                                               ', '.join(report['unusedInfluences'])))
+
+    lines.append('Heaviest influences (total weight, vertices):')
+    order = np.argsort(-report['influenceWeights'], kind='mergesort')[:numInfluences]
+    lines.extend('    %s: %.2f, %d' % (report['influences'][ii], report['influenceWeights'][ii],
+                                       report['influenceVertices'][ii]) for ii in order)
+    return '\n'.join(lines)
+
+
+def runSteps(steps):
+    """
+    Run a generator of steps to its end at once
+    :param steps: generator, see SkinJob
+    :return: None
+    """
+    if steps is not None:
+        for progress in steps:
+            pass
+
+
+class SkinJob(object):
+    """
+    class splitting an export or an import into stages, so it either runs at once or step by step
+    next to the UI, see SkinJobDialog.
+    A stage function returns None, or a generator yielding (done, total) after every block of vertices.
+    Threaded stages only do pure python work like reading, decompressing and remapping the arrays,
+    they run on a worker thread when the job runs in the UI. The other stages use Maya and always
+    run on the main thread, the job can be cancelled between two of their blocks
+    """
+
+    def __init__(self, title):
+        """
+        :param title: str, title of the progress dialog
+        """
+        self.title = title
+        # list of (label, function, threaded)
+        self.stages = []
+        # functions undoing the changes of the finished stages, called in reverse order on cancel
+        self.onCancel = []
+        self.cancelled = False
+        # the values the stages hand over to each other
+        self.state = {}
+        # messages of the threaded stages, printed on the main thread
+        self.messages = []
+
+    def addStage(self, label, function, threaded=False):
+        """
+        :param label: str, shown in the progress dialog while the stage runs
+        :param function: callable without arguments, returns None or a generator of (done, total)
+        :param threaded: bool, the stage does not use Maya and can run on a worker thread
+        :return: None
+        """
+        self.stages.append((label, function, threaded))
+
+    def run(self):
+        """
+        Run all the stages at once on the current thread
+        :return: None
+        """
+        for label, function, threaded in self.stages:
+            runSteps(function())
+            self.printMessages()
+
+    def log(self, message):
+        """
+        Keep a message of a threaded stage, Maya's output is only written from the main thread
+        :param message: str
+        :return: None
+        """
+        self.messages.append(message)
+
+    def printMessages(self):
+        """
+        Print the kept messages, must be called on the main thread
+        :return: None
+        """
+        while self.messages:
+            print self.messages.pop(0)
+
+    def cancel(self):
+        """
+        Stop before the next stage or block and undo the changes already made, must be called on the main thread
+        :return: None
+        """
+        if self.cancelled:
+            return
+        self.cancelled = True
+        for function in reversed(self.onCancel):
+            function()
+        print "Cancelled %s" % self.title
+
+
+class WeightsApi1(object):
+    """
+    class moving weight buffers in and out of a skinCluster through the python API 1.0,
+    the fallback when API 2.0 is not available
+    """
+
+    def __init__(self, fn):
+        """
+        :param fn: MFnSkinCluster of API 1.0
+        """
+        self.fn = fn
+
+    def influenceNames(self):
+        """
+        :return: list(str), partial path names of the influences in skinCluster index order
+        """
+        influencePaths = openmaya.MDagPathArray()
+        numInfluences = self.fn.influenceObjects(influencePaths)
+        return [influencePaths[ii].partialPathName() for ii in xrange(numInfluences)]
+
+    def getGeometryComponents(self, vertices=None):
+        """
+        get the dagPath of the deformed shape and its components(vertex)
+        :param vertices: numpy.ndarray, sorted vertex indices of a region, None for all the deformed vertices
+        :return: dagPath, components
+        """
+        # get dagPath and member components of skined shape
+        # the deformerSet pretty controls which vertex is deformed by the skinCluster
+        # the deformerSet will allows us to pull out that components(vertex) mobject that we need
+        fnSet = openmaya.MFnSet(self.fn.deformerSet())
+        members = openmaya.MSelectionList()
+        # the MSelectionList contains the vertex information in the deformerSet above
+        fnSet.getMembers(members, False)
+
+        dagPath = openmaya.MDagPath()
+        components = openmaya.MObject()
+
+        # dagPath: dagPath of the deformed shape
+        # components: mesh components(vertex)
+        members.getDagPath(0, dagPath, components)
+
+        # only work on a region of the mesh
+        if vertices is not None:
+            components = createVertexComponent(vertices)
+
+        return dagPath, components
+
+    def getElements(self, dagPath, components):
+        """
+        :return: numpy.ndarray, int64 vertex indices of the components
+        """
+        fnComponent = openmaya.MFnSingleIndexedComponent(components)
+        if fnComponent.isComplete():
+            # a complete component does not list its elements
+            return np.arange(openmaya.MFnMesh(dagPath).numVertices())
+
+        indices = openmaya.MIntArray()
+        fnComponent.getElements(indices)
+        return toNumpy(indices, dtype=np.int64)
+
+    def createComponent(self, elements):
+        """
+        :param elements: numpy.ndarray, vertex indices
+        :return: vertex component
+        """
+        return createVertexComponent(elements)
+
+    def getWeights(self, dagPath, components, influences=None):
+        """
+        Get the weights of all the influences. The weights array is a giant single array,
+        size = number of components(vertex) * number of influenceObjects(joints)
+        :param influences: numpy.ndarray, only get the weights of these influence indices
+        :return: numpy.ndarray, flat row major (vertices x influences) weights
+        """
+        weights = openmaya.MDoubleArray()
+        if influences is not None:
+            self.fn.getWeights(dagPath, components, toMIntArray(influences), weights)
+            return toNumpy(weights)
+
+        util = openmaya.MScriptUtil()
+
+        util.createFromInt(0)
+
+        pUInt = util.asUintPtr()
+        # More details see: https://download.autodesk.com/us/maya/2011help/API/class_m_fn_skin_cluster.html#82e83fc5ab653aa15c5431710b3ac86a
+        self.fn.getWeights(dagPath, components, weights, pUInt)
+        return toNumpy(weights)
+
+    def setWeights(self, dagPath, components, influences, weights):
+        """
+        Set the weights of some influences, the weights of the other influences are not touched
+        :param influences: numpy.ndarray, influence indices of the columns of weights
+        :param weights: numpy.ndarray, (vertices x len(influences)) weights
+        :return: None
+        """
+        self.fn.setWeights(dagPath, components, toMIntArray(influences), toMDoubleArray(weights), False)
+
+    def getBlendWeights(self, dagPath, components):
+        """
+        :return: numpy.ndarray, blendWeight of every vertex
+        """
+        weights = openmaya.MDoubleArray()
+        self.fn.getBlendWeights(dagPath, components, weights)
+        return toNumpy(weights)
+
+    def setBlendWeights(self, dagPath, components, blendWeights):
+        """
+        :param blendWeights: numpy.ndarray, blendWeight of every vertex
+        :return: None
+        """
+        self.fn.setBlendWeights(dagPath, components, toMDoubleArray(blendWeights))
+
+
+class WeightsApi2(WeightsApi1):
+    """
+    class moving weight buffers in and out of a skinCluster through the python API 2.0,
+    the arrays are built from and returned as python sequences in one call, without MScriptUtil pointers
+    """
+
+    def __init__(self, node):
+        """
+        :param node: str, skinCluster node
+        """
+        selectionList = openmaya2.MSelectionList()
+        selectionList.add(node)
+        self.fn = openmayaanim2.MFnSkinCluster(selectionList.getDependNode(0))
+
+    def influenceNames(self):
+        return [path.partialPathName() for path in self.fn.influenceObjects()]
+
+    def getGeometryComponents(self, vertices=None):
+        dagPath = self.fn.getPathAtIndex(0)
+        if vertices is not None:
+            return dagPath, self.createComponent(vertices)
+
+        fnComponent = openmaya2.MFnSingleIndexedComponent()
+        components = fnComponent.create(openmaya2.MFn.kMeshVertComponent)
+        fnComponent.setCompleteData(openmaya2.MFnMesh(dagPath).numVertices)
+        return dagPath, components
+
+    def getElements(self, dagPath, components):
+        fnComponent = openmaya2.MFnSingleIndexedComponent(components)
+        if fnComponent.isComplete:
+            return np.arange(openmaya2.MFnMesh(dagPath).numVertices)
+        elements = fnComponent.getElements()
+        return np.fromiter(elements, dtype=np.int64, count=len(elements))
+
+    def createComponent(self, elements):
+        fnComponent = openmaya2.MFnSingleIndexedComponent()
+        components = fnComponent.create(openmaya2.MFn.kMeshVertComponent)
+        fnComponent.addElements(np.asarray(elements, dtype=np.int64).tolist())
+        return components
+
+    def getWeights(self, dagPath, components, influences=None):
+        if influences is None:
+            weights = self.fn.getWeights(dagPath, components)[0]
+        else:
+            weights = self.fn.getWeights(dagPath, components,
+                                         openmaya2.MIntArray(np.asarray(influences, dtype=np.int64).tolist()))
+        return np.fromiter(weights, dtype=np.float64, count=len(weights))
+
+    def setWeights(self, dagPath, components, influences, weights):
+        self.fn.setWeights(dagPath, components,
+                           openmaya2.MIntArray(np.asarray(influences, dtype=np.int64).tolist()),
+                           openmaya2.MDoubleArray(np.ascontiguousarray(weights, dtype=np.float64).ravel().tolist()),
+                           False, False)
+
+    def getBlendWeights(self, dagPath, components):
+        weights = self.fn.getBlendWeights(dagPath, components)
+        return np.fromiter(weights, dtype=np.float64, count=len(weights))
+
+    def setBlendWeights(self, dagPath, components, blendWeights):
+        self.fn.setBlendWeights(dagPath, components,
+                                openmaya2.MDoubleArray(np.asarray(blendWeights, dtype=np.float64).tolist()))
+
+
+class WeightSnapshot(object):
+    """
+    class holding the weights of some vertices and influences of a skinCluster as zlib compressed CSR blocks,
+    only the vertices and influences setData writes are kept so undo does not hold dense copies of the mesh
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: str, shape deformed by the skinCluster
+        """
+        self.shape = shape
+        # list of {array name: (compressed bytes, dtype, shape)}
+        self.blocks = []
+        self.nbytes = 0
+        self.released = False
+
+    @staticmethod
+    def pack(array):
+        array = np.ascontiguousarray(array)
+        return zlib.compress(array.tostring(), 1), array.dtype.str, array.shape
+
+    @staticmethod
+    def unpack(packed):
+        buffer, dtype, shape = packed
+        return np.frombuffer(zlib.decompress(buffer), dtype=dtype).reshape(shape)
+
+    def addWeights(self, elements, columns, weights):
+        """
+        :param elements: numpy.ndarray, vertex indices of the block
+        :param columns: numpy.ndarray, influence indices of the columns of weights
+        :param weights: numpy.ndarray, (len(elements) x len(columns)) weights
+        :return: None
+        """
+        offsets, indices, values = weightUtils.denseToSparse(weights)
+        self.addBlock({'elements': elements.astype(np.int32),
+                       'columns': columns.astype(np.int32),
+                       'offsets': offsets,
+                       'indices': weightUtils.compactIndices(indices, len(columns)),
+                       'values': values})
+
+    def addBlendWeights(self, elements, blendWeights):
+        """
+        :param elements: numpy.ndarray, vertex indices of the block
+        :param blendWeights: numpy.ndarray, blendWeight of every vertex of the block
+        :return: None
+        """
+        self.addBlock({'elements': elements.astype(np.int32),
+                       'blendWeights': blendWeights})
+
+    def addBlock(self, arrays):
+        block = dict((name, WeightSnapshot.pack(array)) for name, array in arrays.items())
+        self.nbytes += sum(len(packed[0]) for packed in block.values())
+        self.blocks.append(block)
+
+    def restore(self):
+        """
+        Set the weights of the snapshot in the skinCluster
+        :return: None
+        """
+        if self.released:
+            print "The undo snapshot of %s was released to stay within SkinCluster.kUndoBudget, " \
+                  "its weights are not changed" % self.shape
+            return
+
+        weightsApi = SkinCluster(self.shape).weightsApi
+        dagPath = weightsApi.getGeometryComponents()[0]
+        for block in self.blocks:
+            arrays = dict((name, WeightSnapshot.unpack(packed)) for name, packed in block.items())
+            components = weightsApi.createComponent(arrays['elements'])
+            if 'blendWeights' in arrays:
+                weightsApi.setBlendWeights(dagPath, components, arrays['blendWeights'])
+            else:
+                weights = weightUtils.sparseToDense(arrays['offsets'], arrays['indices'], arrays['values'],
+                                                    len(arrays['columns']))
+                weightsApi.setWeights(dagPath, components, arrays['columns'], weights)
+
+    def release(self):
+        """
+        Free the weights, restoring the snapshot does nothing afterwards
+        :return: None
+        """
+        self.blocks = []
+        self.nbytes = 0
+        self.released = True
+
+
+def keepUndoSnapshots(*snapshots):
+    """
+    Register the snapshots committed to the undo queue and release the oldest ones beyond SkinCluster.kUndoBudget
+    :param snapshots: WeightSnapshot
+    :return: None
+    """
+    undoSnapshots.extend(weakref.ref(snapshot) for snapshot in snapshots)
+
+    # forget the snapshots of the commands Maya flushed from its undo queue
+    alive = [snapshot for snapshot in (ref() for ref in undoSnapshots) if snapshot is not None]
+    undoSnapshots.clear()
+    undoSnapshots.extend(weakref.ref(snapshot) for snapshot in alive)
+
+    total = sum(snapshot.nbytes for snapshot in alive)
+    while alive and total > SkinCluster.kUndoBudget:
+        oldest = alive.pop(0)
+        undoSnapshots.popleft()
+        total -= oldest.nbytes
+        oldest.release()
+
+
+class SkinCluster(object):
+    # global variable extension
+    kFileExtension = '.skin'
+    # skinningMethod value of weight blended, the only method which uses the blendWeights
+    kWeightBlended = 2
+    # file name of the manifest written next to the .skin files by exportAll
+    kManifestName = 'skinManifest.json'
+    # number of vertices per hashed block, the granularity of delta exports
+    kHashBlockSize = 1024
+    # influence remap strategies tried by imports, in order
+    kRemapStrategies = influenceMatch.kStrategies
+    # move the weights through API 2.0 when it is available, set to False to force the API 1.0 path
+    kUseApi2 = True
+    # vertices per block of the exports and imports running next to the UI, one block per event loop iteration
+    kAsyncBlockSize = 10000
+    # vertices per setWeights call when no blockSize is given, the weights reach Maya through python lists
+    # so setting the whole mesh at once would hold several copies of it
+    kSetBlockSize = 10000
+    # influences per vertex the engine skins, more are reported by getSkinReport
+    kEngineMaxInfluences = 4
+    # bytes of compressed weight snapshots held for undoing setData, the oldest are released beyond it
+    kUndoBudget = 256 * 1024 * 1024
+
+    @classmethod
+    def export(cls, filePath=None, shape=None, blockSize=None, compression=None, vertices=None,
+               pruneBelow=0.0, maxInfluences=None, quantization=None, geometry=True):
+        job = SkinCluster.exportJob(filePath, shape, blockSize, compression, vertices, pruneBelow, maxInfluences,
+                                    quantization, geometry)
+        if job:
+            job.run()
+
+    @classmethod
+    def exportAsync(cls, filePath=None, shape=None, blockSize=None, **kwargs):
+        """
+        Export with a progress dialog while the UI stays usable, see exportJob
+        :param blockSize: int, vertices read per event loop iteration, SkinCluster.kAsyncBlockSize when None
+        :return: SkinJobDialog or None
+        """
+        job = SkinCluster.exportJob(filePath, shape, blockSize or SkinCluster.kAsyncBlockSize, **kwargs)
+        return SkinJobDialog.start(job)
+
+    @classmethod
+    def exportJob(cls, filePath=None, shape=None, blockSize=None, compression=None, vertices=None,
+                  pruneBelow=0.0, maxInfluences=None, quantization=None, geometry=True):
+        """
+        Prepare the export of the skin weights of a shape, see exportSkin for the parameters
+        :return: SkinJob or None when no file is chosen
+        """
+        # selected vertices export only their region
+        if not shape and vertices is None:
+            shape, vertices = SkinCluster.getSelectedVertices()
+        skin = SkinCluster(shape, blockSize=blockSize, vertices=vertices)
+        return skin.exportSkinJob(filePath, compression=compression, pruneBelow=pruneBelow,
+                                  maxInfluences=maxInfluences, quantization=quantization, geometry=geometry)
+
+    @classmethod
+    def mirror(cls, shape=None, axis='x', positive=True, sides=('L_', 'R_'), tolerance=None, centerTolerance=1e-3):
+        """
+        Mirror the skin weights of a symmetric mesh from one side to the other, see mirrorSkinData
+        :param shape: str, skinned mesh, the selection is used when empty
+        :param axis: str, 'x', 'y' or 'z', normal of the world space mirror plane through the origin
+        :param positive: bool, copy the weights from the positive side to the negative side
+        :param sides: (str, str), prefixes of the left and right influences
+        :param tolerance: float, vertices without a partner within this distance keep their weights
+        :param centerTolerance: float, vertices this close to the mirror plane keep their weights
+        :return: int, number of mirrored vertices
+        """
+        skin = SkinCluster(shape)
+        skin.gatherData(geometry=True)
+        data, numUnmatched = mirrorSkinData(skin.data, axis, positive, sides, tolerance, centerTolerance)
+        if numUnmatched:
+            print "%d vertices have no mirror partner within %s" % (numUnmatched, tolerance)
+
+        # only the vertices of the destination side are set, in blocks of SkinCluster.kSetBlockSize vertices
+        region = SkinCluster(skin.shape, vertices=data['vertexIndices'])
+        region.setData(data, force=True)
+        print "Mirrored %d vertices of %s" % (data['vertexCount'], skin.node)
+        return data['vertexCount']
 
+    @classmethod
+    def exportAll(cls, directory=None, root=None, sparse=True, blockSize=None, threads=4, compression=None,
+                  shapes=None, quantization=None, geometry=True):
+        """
+        Export every skinned mesh under root, or in the whole scene, to one directory in a single pass.
+        The weights are pulled out of Maya on the main thread while the sparse conversion and the file
+        writing of the previous meshes run on a thread pool. A manifest lists every mesh and its file,
+        meshes bound to the same skeleton share one influence list in the manifest.
+        :param directory: str, output directory, a directory dialog is opened when None
+        :param root: str, top node of the rig, None exports all the skinned meshes in the scene
+        :param sparse: bool, store only the non zero weights in CSR arrays instead of the dense matrix
+        :param blockSize: int, stream the weights of each mesh in blocks of this many vertices
+        :param threads: int, number of writer threads
+        :param compression: str, 'zlib' or 'bz2' to compress the arrays, None writes them raw
+        :param shapes: list(str), export these skinned meshes instead of all the meshes under root
+        :param quantization: int, 8 or 16 to store the weights as uint8 or uint16, see writeSkinFile
+        :param geometry: bool or 'points', store the geometry to transfer the weights, see gatherData
+        :return: str, path of the manifest
+        """
+        if directory == None:
+            startDir = cmds.workspace(q=1, rootDirectory=1)
+            directory = cmds.fileDialog2(dialogStyle=2, fileMode=3, startingDirectory=startDir)
 
-class SkinCluster(object):
-    # global variable extension
-    kFileExtension = '.skin'
+        if not directory:
+            return
+        if not isinstance(directory, basestring):
+            directory = directory[0]
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        manifest = {'version': skinFile.kVersion,
+                    'influences': [],
+                    'meshes': []}
+        # influence list -> index in manifest['influences']
+        skeletons = {}
+        fileNames = set()
+
+        pool = ThreadPool(threads)
+        results = []
+        try:
+            # the shape and skinCluster lookups of the listing are reused by every mesh
+            with lookupCache:
+                if shapes is None:
+                    shapes = SkinCluster.listSkinnedShapes(root)
+                else:
+                    shapes = cmds.ls(shapes, long=1) or []
+                for shape in shapes:
+                    skin = SkinCluster(shape, blockSize=blockSize)
+                    skin.gatherData(geometry)
+
+                    skeleton = tuple(skin.data['influences'])
+                    if skeleton not in skeletons:
+                        skeletons[skeleton] = len(manifest['influences'])
+                        manifest['influences'].append(list(skeleton))
+
+                    # name the file after the transform, the short name is not unique in every scene
+                    fileName = shape.split('|')[-2] if shape.count('|') > 1 else shape.split('|')[-1]
+                    fileName = fileName.replace(':', '_')
+                    baseName = fileName
+                    count = 1
+                    while fileName in fileNames:
+                        fileName = '%s%d' % (baseName, count)
+                        count += 1
+                    fileNames.add(fileName)
+                    fileName += SkinCluster.kFileExtension
+
+                    manifest['meshes'].append({'shape': shape,
+                                               'skinCluster': skin.node,
+                                               'file': fileName,
+                                               'influences': skeletons[skeleton],
+                                               'vertexCount': skin.data['vertexCount']})
+                    results.append(pool.apply_async(writeSkinFile, (os.path.join(directory, fileName), skin.data,
+                                                                          sparse, compression),
+                                                    {'quantization': quantization}))
+
+            # re-raise the first error of the writer threads
+            for result in results:
+                result.get()
+        finally:
+            pool.close()
+            pool.join()
+
+        manifestPath = os.path.join(directory, SkinCluster.kManifestName)
+        with open(manifestPath, 'w') as fh:
+            json.dump(manifest, fh, indent=4)
+
+        print "Exported %d skinClusters to %s" % (len(manifest['meshes']), directory)
+        return manifestPath
 
     @classmethod
-    def export(cls, filePath=None, shape=None):
-        skin = SkinCluster(shape)
-        skin.exportSkin(filePath)
+    def listSkinnedShapes(cls, root=None):
+        """
+        List the meshes deformed by a skinCluster in one query of all the skinClusters in the scene
+        :param root: str, only return the meshes under this node, None returns all of them
+        :return: list(str), long names of the skinned mesh shapes
+        """
+        shapes = []
+        for node in cmds.ls(type='skinCluster') or []:
+            shapes.extend(cmds.skinCluster(node, q=1, geometry=1) or [])
+
+        shapes = cmds.ls(shapes, long=1, type='mesh') or []
+        if root:
+            rootPath = cmds.ls(root, long=1)[0] + '|'
+            shapes = [x for x in shapes if x.startswith(rootPath)]
+
+        # a shape deformed by a chain of skinClusters is only exported once
+        return sorted(set(shapes))
 
     @classmethod
-    def createAndImport(cls, filePath=None, shape=None):
+    def createAndImport(cls, filePath=None, shape=None, blockSize=None, transfer=None, vertices=None,
+                        pruneBelow=0.0, maxInfluences=None, mapping=None, strategies=None, interactive=False):
         """
         Create a skinCluster on the specified shape if one does not already exist
-        and then import the weight data.
+        and then import the weight data, see importJob for the parameters
+        :return:
+        """
+        job = SkinCluster.importJob(filePath, shape, blockSize, transfer, vertices, pruneBelow, maxInfluences,
+                                    mapping, strategies, interactive)
+        if job:
+            job.run()
+
+    @classmethod
+    def importAsync(cls, filePath=None, shape=None, blockSize=None, **kwargs):
+        """
+        Import with a progress dialog while the UI stays usable, see importJob.
+        Cancelling an import which created the skinCluster deletes it again
+        :param blockSize: int, vertices set per event loop iteration, SkinCluster.kAsyncBlockSize when None
+        :return: SkinJobDialog or None
+        """
+        job = SkinCluster.importJob(filePath, shape, blockSize or SkinCluster.kAsyncBlockSize, **kwargs)
+        return SkinJobDialog.start(job)
+
+    @classmethod
+    def importJob(cls, filePath=None, shape=None, blockSize=None, transfer=None, vertices=None,
+                  pruneBelow=0.0, maxInfluences=None, mapping=None, strategies=None, interactive=False):
+        """
+        Prepare the import of a skin file, the file is checked against the shape right away.
+        Reading and remapping the arrays is a threaded stage, creating the skinCluster and setting
+        the weights runs on the main thread
         :param filePath: filePath of the skinWeights
         :param shape: mesh shape which skinCluster deforms
-        :return:
+        :param blockSize: int, number of vertices set per setWeights call, SkinCluster.kSetBlockSize when None
+        :param transfer: str, 'nearest' or 'barycentric' to map the weights through the vertex positions
+                         stored in the file, for meshes which were edited since the export.
+                         'auto' only transfers barycentric when the topology does not match the file
+        :param vertices: list(int) or xrange, only import the weights of these vertices,
+                         a file exported from a region is imported on its vertices by default
+        :param pruneBelow: float, remove imported weights smaller than this and renormalize
+        :param maxInfluences: int, keep the largest weights of every vertex and renormalize
+        :param mapping: dict or str json file path, {imported influence: scene influence} for the influences
+                        which do not match by name
+        :param strategies: list(str), remap strategies of influenceMatch, SkinCluster.kRemapStrategies when None
+        :param interactive: bool, ask the user to map the influences which are still unmatched
+        :return: SkinJob or None when no file is chosen
         """
 
+        # selected vertices only import their region
+        if not shape and vertices is None:
+            shape, vertices = SkinCluster.getSelectedVertices()
+
         if not shape:
             try:
                 shape = cmds.ls(sl=1)[0]
@@ -100,60 +1319,197 @@ class SkinCluster(object):
         if not isinstance(filePath, basestring):
             filePath = filePath[0]
 
-        # Read the data from the file
-        fh = open(filePath, 'rb')
-        data = pickle.load(fh)
-        fh.close()
+        # Open the file, only the header is read here
+        skinData = skinFile.load(filePath)
+        header = skinData.header
+
+        # Make sure the vertex count and the topology are the same, a mismatch is found from the header
+        # before any weight is read
+        mismatch = None
+        if not transfer or transfer == 'auto':
+            meshVertices = cmds.polyEvaluate(shape, vertex=1)
+            importedVertices = header.get('meshVertexCount', header['vertexCount'])
+            if meshVertices != importedVertices:
+                mismatch = 'Vertex counts do not match. %d != %d' % (meshVertices, importedVertices)
+            elif header.get('fingerprint'):
+                fingerprint = SkinCluster.getGeometryFingerprint(shape)
+                if not matchFingerprint(header['fingerprint'], fingerprint):
+                    mismatch = 'Geometry does not match. %s != %s' % (fingerprint, header['fingerprint'])
+
+        if transfer == 'auto':
+            transfer = 'barycentric' if mismatch else None
+            if mismatch:
+                print "%s, transferring the weights by position" % mismatch
+        elif mismatch:
+            raise RuntimeError('%s, import with a transfer mode to map the weights by position' % mismatch)
+
+        job = SkinJob('Import %s' % os.path.basename(filePath))
+        # the positions are queried on the main thread, the transfer itself is pure numpy
+        points = SkinCluster.getPoints(shape) if transfer else None
+
+        def read():
+            # the weights are memory mapped, pages are read when they are copied into the skinCluster
+            # a delta file is applied on top of its base files
+            data = readSkinData(skinData)
+
+            if transfer:
+                region = vertices
+                if region is None and 'vertexIndices' in data and 'points' in data:
+                    # the target vertices of a region file are the ones closest to its stored positions
+                    region = spatialIndex.SpatialHash(points).nearest(data['points'])[0]
+                if region is None:
+                    data = transferSkinData(data, points, transfer)
+                else:
+                    region = np.unique(np.asarray(region, dtype=np.int64))
+                    data = transferSkinData(data, points[region], transfer)
+                    data['vertexIndices'] = region
+
+            if pruneBelow or maxInfluences:
+                data, numChanged = cleanSkinData(data, pruneBelow, maxInfluences)
+                job.log("Cleaned the weights of %d vertices" % numChanged)
+
+            # restrict the import to a region, the rest of the mesh keeps its weights
+            if vertices is not None or 'vertexIndices' in data:
+                data = selectSkinRows(data, data['vertexIndices'] if vertices is None else vertices)
+            job.state['data'] = data
+
+        def write():
+            data = job.state['data']
+            regionVertices = data.get('vertexIndices')
+
+            # check if the shape already has a skinCluster
+            if SkinCluster.getSkinCluster(shape):
+                skinCluster = SkinCluster(shape, blockSize=blockSize, vertices=regionVertices)
+                # the existing skinCluster may already hold these weights
+                created = False
+            else:
+                node = SkinCluster.createSkinCluster(shape, data, mapping, strategies, interactive)
+                # a cancelled import leaves the shape unskinned as it was
+                job.onCancel.append(partial(cmds.delete, node))
+                skinCluster = SkinCluster(shape, blockSize=blockSize, vertices=regionVertices)
+                created = True
 
-        # Make sure the vertex count is the same
-        meshVertices = cmds.polyEvaluate(shape, vertex=1)
+            for progress in skinCluster.iterSetData(data, force=created, mapping=mapping, strategies=strategies,
+                                                    interactive=interactive, created=created):
+                yield progress
+            print "Imported %s" % filePath
 
-        importedVertices = len(data['blendWeights'])
-        if meshVertices != importedVertices:
-            raise RuntimeError('Vertex counts do not match. %d != %d' % (meshVertices, importedVertices))
+        job.addStage('Reading %s' % filePath, read, threaded=True)
+        job.addStage('Setting the weights of %s' % shape, write)
+        return job
 
+    @classmethod
+    def createSkinCluster(cls, shape, data, mapping=None, strategies=None, interactive=False):
+        """
+        Bind the shape to the scene joints of the influences of the skin data,
+        unmatched influences are remapped and renamed in data['influences']
+        :param shape: mesh shape without a skinCluster
+        :param data: dict, skin data
+        :param mapping: dict or str json file path, see remapInfluences
+        :param strategies: list(str), see remapInfluences
+        :param interactive: bool, see remapInfluences
+        :return: str, the new skinCluster node
+        """
+        joints = data['influences']
 
-        # check if the shape already has a skinCluster
-        if SkinCluster.getSkinCluster(shape):
-            skinCluster = SkinCluster(shape)
-        else:
-            # create a new skinCluster
-            joints = data['weights'].keys()
+        # Make sure all the joints exist
+        sceneJoints = cmds.ls(type='joint')
+        sceneTable = SkinCluster.buildInfluenceTable(sceneJoints)
 
-            # Make sure all the joints exist
+        unusedImports = [j for j in joints if j not in sceneTable]
+        # Create a set for get which joint in the scene doesn't have weights
+        noMatch = set(sceneTable.keys()).difference(joints)
 
-            unusedImports = []
-            # Create a set for get which joint in the scene doesn't have weights
-            noMatch = set([SkinCluster.removeNamespaceFromString(x) for x in cmds.ls(type='joint')])
+        # Remapping the joints
+        if unusedImports and noMatch:
+            remapped = SkinCluster.remapInfluences(unusedImports, noMatch, mapping, strategies, interactive)
 
-            for j in joints:
-                if j in noMatch:
-                    noMatch.remove(j)
-                else:
-                    unusedImports.append(j)
+            # rename the remapped columns, the weight matrix itself stays untouched
+            data['influences'] = [remapped.get(x, x) for x in data['influences']]
 
-            # Remapping the joints
-            # if there were unmapped influences ask the user to map them
-            if unusedImports and noMatch:
+        # Create the skinCluster with post normalization so setting the weights does not
+        # normalize all weights, use the scene names in case the joints are in a namespace
+        joints = [sceneJoints[sceneTable[j]] for j in data['influences'] if j in sceneTable]
 
-                mappingDialog = WeightRemapDialog(getMayaWindow())
-                mappingDialog.setInfluences(unusedImports, noMatch)
-                mappingDialog.exec_()
+        return cmds.skinCluster(joints, shape, tsb=1, nw=2, n=data['name'])[0]
 
-                for src, dst in mappingDialog.mapping.items():
-                    # swap the mapping
-                    data['weights'][dst] = data['weights'][src]
-                    del data['weights'][src]
+    @classmethod
+    def propagateLods(cls, source=None, targets=None, mode='barycentric', pruneBelow=0.0, maxInfluences=None):
+        """
+        Copy the weights of a skinned LOD0 mesh onto all the other LOD meshes in one pass.
+        The weights of the source are gathered and its spatial index built once, then every target
+        is queried against it and gets its weights in blocks of SkinCluster.kSetBlockSize vertices.
+        Targets without a skinCluster are bound to the same joints
+        :param source: str, LOD0 mesh with a skinCluster, the first selected mesh when None
+        :param targets: list(str), LOD meshes, the other selected meshes when None
+        :param mode: str, 'nearest' or 'barycentric', see transferSkinData
+        :param pruneBelow: float, remove transferred weights smaller than this and renormalize
+        :param maxInfluences: int, keep the largest weights of every vertex and renormalize,
+                              usually the influence budget of the lower LODs
+        :return: list(str), the skinClusters of the targets
+        """
+        if not source:
+            selection = cmds.ls(sl=1) or []
+            if len(selection) < 2:
+                raise RuntimeError('Select the skinned LOD0 mesh and then the LOD meshes')
+            source, targets = selection[0], selection[1:]
+
+        skinClusters = []
+        with lookupCache:
+            sourceSkin = SkinCluster(source)
+            sourceSkin.gatherData(geometry=True)
+            data = sourceSkin.data
+            index = spatialIndex.SurfaceIndex(data['points'], data['triangles'] if mode == 'barycentric' else None)
+
+            for target in targets:
+                targetData = transferSkinData(data, SkinCluster.getPoints(target), mode, index=index)
+                if pruneBelow or maxInfluences:
+                    targetData, numChanged = cleanSkinData(targetData, pruneBelow, maxInfluences)
+                    print "Cleaned the weights of %d vertices of %s" % (numChanged, target)
+
+                created = not SkinCluster.getSkinCluster(target)
+                if created:
+                    targetData['name'] = '%s_skinCluster' % getShape(target).split('|')[-1]
+                    SkinCluster.createSkinCluster(target, targetData)
+
+                # no blockSize, the transferred weights are already in memory and are set in bounded blocks
+                targetSkin = SkinCluster(target)
+                targetSkin.setData(targetData, force=True, created=created)
+                skinClusters.append(targetSkin.node)
+                print "Propagated %s to %s (%d vertices)" % (sourceSkin.node, target, targetData['vertexCount'])
+
+        return skinClusters
 
-            # Create the skinCluster with post normalization so setting the weights does not
-            # normalize all weights
-            joints = data['weights'].keys()
+    @classmethod
+    def remapInfluences(cls, importedInfluences, existingInfluences, mapping=None, strategies=None,
+                        interactive=False):
+        """
+        Map the imported influences which have no influence of the same name to the existing influences
+        which receive no weights, without any user interaction unless interactive is set
+        :param importedInfluences: list(str), unmatched imported influences
+        :param existingInfluences: list(str), unmatched existing influences
+        :param mapping: dict or str json file path, explicit {imported influence: existing influence},
+                        applied before the strategies
+        :param strategies: list(str), strategies of influenceMatch in the order they are tried,
+                           SkinCluster.kRemapStrategies when None
+        :param interactive: bool, open the WeightRemapDialog for the influences which are still unmatched
+        :return: dict, {imported influence: existing influence}
+        """
+        matcher = influenceMatch.InfluenceMatcher(existingInfluences, strategies or SkinCluster.kRemapStrategies)
+        remapped = matcher.match(importedInfluences, mapping)
+        for src in sorted(remapped):
+            print "Remapped %s -> %s" % (src, remapped[src])
 
-            skinCluster = cmds.skinCluster(joints, shape, tsb=1, nw=2, n=data['name'])
-            skinCluster = SkinCluster(shape)
+        unmatched = [x for x in importedInfluences if x not in remapped]
+        if unmatched and interactive:
+            mappingDialog = WeightRemapDialog(getMayaWindow())
+            mappingDialog.setInfluences(importedInfluences, existingInfluences, remapped)
+            mappingDialog.exec_()
+            return mappingDialog.mapping
 
-        skinCluster.setData(data)
-        print "Imported %s" % filePath
+        if unmatched:
+            print "Skipped the weights of the unmatched influences %s" % ', '.join(unmatched)
+        return remapped
 
     @classmethod
     def getSkinCluster(cls, shape):
@@ -163,15 +1519,104 @@ class SkinCluster(object):
         :return: The attached skinCluster name or None if no skinCluster is attached
         """
         shape = getShape(shape)
+        if lookupCache.isActive() and shape in lookupCache.skinClusters:
+            return lookupCache.skinClusters[shape]
+
         history = cmds.listHistory(shape, pruneDagObjects=1, interestLevel=2)
 
-        if not history:
-            return None
-        skins = [x for x in history if cmds.nodeType(x) == 'skinCluster']
+        # filter the history by type in one query instead of asking the type of every node
+        skins = cmds.ls(history, type='skinCluster') if history else None
+        skin = skins[0] if skins else None
 
-        if skins:
-            return skins[0]
-        return None
+        if lookupCache.isActive():
+            lookupCache.skinClusters[shape] = skin
+        return skin
+
+    @classmethod
+    def getGeometryFingerprint(cls, shape):
+        """
+        Get a cheap description of the geometry to check if a .skin file fits the shape.
+        The vertex count of every face and the vertex indices of the faces are read in one call and hashed,
+        so meshes with the same number of vertices but other faces or another vertex order do not match
+        :param shape: Shape node name
+        :return: dict, {'vertex': int, 'edge': int, 'face': int, 'topology': str md5 hex digest}
+        """
+        selectionList = openmaya.MSelectionList()
+        selectionList.add(getShape(shape))
+        dagPath = openmaya.MDagPath()
+        selectionList.getDagPath(0, dagPath)
+
+        fnMesh = openmaya.MFnMesh(dagPath)
+        vertexCounts = openmaya.MIntArray()
+        vertices = openmaya.MIntArray()
+        fnMesh.getVertices(vertexCounts, vertices)
+
+        topology = hashlib.md5()
+        topology.update(toNumpy(vertexCounts, dtype=np.int32).tostring())
+        topology.update(toNumpy(vertices, dtype=np.int32).tostring())
+        return {'vertex': fnMesh.numVertices(),
+                'edge': fnMesh.numEdges(),
+                'face': vertexCounts.length(),
+                'topology': topology.hexdigest()}
+
+    @classmethod
+    def getSelectedVertices(cls):
+        """
+        Get the selected vertices of the first selected mesh with one API query
+        :return: (str shape, numpy.ndarray vertex indices), (None, None) if no vertex is selected
+        """
+        selectionList = openmaya.MSelectionList()
+        openmaya.MGlobal.getActiveSelectionList(selectionList)
+
+        for ii in xrange(selectionList.length()):
+            dagPath = openmaya.MDagPath()
+            component = openmaya.MObject()
+            selectionList.getDagPath(ii, dagPath, component)
+            if component.isNull() or not component.hasFn(openmaya.MFn.kMeshVertComponent):
+                continue
+
+            indices = openmaya.MIntArray()
+            openmaya.MFnSingleIndexedComponent(component).getElements(indices)
+            return dagPath.partialPathName(), toNumpy(indices, dtype=np.int64)
+
+        return None, None
+
+    @classmethod
+    def getPoints(cls, shape):
+        """
+        Get the world space vertex positions with one query for the whole mesh
+        :param shape: Shape node name
+        :return: numpy.ndarray, (vertices x 3) positions
+        """
+        shape = getShape(shape)
+        points = cmds.xform('%s.vtx[*]' % shape, q=1, worldSpace=1, translation=1)
+        return np.array(points, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def getTriangles(cls, shape):
+        """
+        Get the vertex indices of the triangulated mesh
+        :param shape: Shape node name
+        :return: numpy.ndarray, (triangles x 3) int32 vertex indices
+        """
+        selectionList = openmaya.MSelectionList()
+        selectionList.add(getShape(shape))
+        dagPath = openmaya.MDagPath()
+        selectionList.getDagPath(0, dagPath)
+
+        triangleCounts = openmaya.MIntArray()
+        triangleVertices = openmaya.MIntArray()
+        openmaya.MFnMesh(dagPath).getTriangles(triangleCounts, triangleVertices)
+        return toNumpy(triangleVertices, dtype=np.int32).reshape(-1, 3)
+
+    @classmethod
+    def buildInfluenceTable(cls, influenceNames):
+        """
+        Build the lookup table used to match influences by their name without namespace
+        :param influenceNames: list(str), influence names, with or without namespace
+        :return: dict, {name without namespace: index in influenceNames}
+        """
+        return dict((SkinCluster.removeNamespaceFromString(name), ii) for ii, name in enumerate(influenceNames))
 
     @classmethod
     def removeNamespaceFromString(cls, influenceName):
@@ -192,7 +1637,15 @@ class SkinCluster(object):
 
         return result
 
-    def __init__(self, shape=None):
+    def __init__(self, shape=None, blockSize=None, vertices=None):
+        """
+        :param shape: str, shape or transform with a skinCluster, the selection is used when empty
+        :param blockSize: int, stream the weights in blocks of this many vertices so the peak memory
+                          does not depend on the mesh size, None reads the whole mesh at once
+                          and sets it in blocks of SkinCluster.kSetBlockSize
+        :param vertices: list(int) or xrange, only gather and set the weights of these vertices,
+                         None works on the whole mesh
+        """
         if not shape:
             try:
                 shape = cmds.ls(sl=1)[0]
@@ -215,67 +1668,159 @@ class SkinCluster(object):
         self.mobj = openmaya.MObject()
         selectionList.getDependNode(0, self.mobj)
         self.fn = openmayaanim.MFnSkinCluster(self.mobj)
-        self.data = {'weights': {},
-                     'blendWeights': [],
+        # the weight buffers are moved by API 2.0 if possible
+        if openmaya2 is not None and SkinCluster.kUseApi2:
+            self.weightsApi = WeightsApi2(self.node)
+        else:
+            self.weightsApi = WeightsApi1(self.fn)
+        self.blockSize = blockSize
+        # sorted unique vertex indices of the region, None for the whole mesh
+        self.vertices = None if vertices is None else np.unique(np.asarray(vertices, dtype=np.int64))
+        # partial path names of the influences and their lookup table, built on first use
+        self.influenceNames = None
+        self.influenceTable = None
+        # weights: (vertices x influences) matrix, columns ordered as data['influences']
+        # imported data may hold the weights as CSR 'offsets', 'indices' and 'values' arrays instead
+        self.data = {'weights': np.zeros((0, 0)),
+                     'influences': [],
+                     'vertexCount': 0,
                      'name': self.node}
 
-    def gatherData(self):
+    def getInfluenceTable(self):
+        """
+        Get the influences of the skinCluster, the namespaces are stripped once per skinCluster
+        :return: (list(str) partial path names in skinCluster index order, dict {name without namespace: index})
+        """
+        if self.influenceTable is None:
+            self.influenceNames = self.weightsApi.influenceNames()
+            self.influenceTable = SkinCluster.buildInfluenceTable(self.influenceNames)
+
+        return self.influenceNames, self.influenceTable
+
+    def gatherData(self, geometry=True):
         """
         get and store the skinningMethod and normalizeWeights attributes in data dictionary
+        the blendWeights are only gathered when the skinningMethod uses them
+        :param geometry: bool, also store the vertex positions and triangles used to transfer the weights,
+                         'points' only stores the positions, enough for 'nearest' transfers
         :return: None
         """
-        dagPath, components = self.__getGeometryComponents()
-        self.gatherInfluenceWeights(dagPath, components)
-        self.gatherBlendWeights(dagPath, components)
+        runSteps(self.iterGatherData(geometry))
 
+    def iterGatherData(self, geometry=True):
+        """
+        gatherData one block of vertices at a time
+        :param geometry: bool, see gatherData
+        :return: generator of (vertices done, total vertices) after every block
+        """
         for attr in ['skinningMethod', 'normalizeWeights']:
             self.data[attr] = cmds.getAttr('%s.%s' % (self.node, attr))
 
+        dagPath, components = self.__getGeometryComponents()
+        for progress in self.__iterInfluenceWeights(dagPath, components):
+            yield progress
+        if self.data['skinningMethod'] == SkinCluster.kWeightBlended:
+            for progress in self.__iterBlendWeights(dagPath, components):
+                yield progress
+        else:
+            self.data.pop('blendWeights', None)
+
+        self.data['fingerprint'] = SkinCluster.getGeometryFingerprint(self.shape)
+
+        # a region stores which mesh vertices its rows belong to
+        if self.vertices is not None:
+            self.data['vertexIndices'] = self.vertices
+            self.data['meshVertexCount'] = self.data['fingerprint']['vertex']
+        else:
+            self.data.pop('vertexIndices', None)
+            self.data.pop('meshVertexCount', None)
+
+        self.data.pop('points', None)
+        self.data.pop('triangles', None)
+        if geometry:
+            # positions are stored in single precision, enough to find the matching vertices
+            points = SkinCluster.getPoints(self.shape).astype(np.float32)
+            if self.vertices is None:
+                self.data['points'] = points
+                if geometry != 'points':
+                    self.data['triangles'] = SkinCluster.getTriangles(self.shape)
+            else:
+                # the triangles of a region are not stored, it can only be transferred to the nearest vertices
+                self.data['points'] = points[self.vertices]
+
     def __getGeometryComponents(self):
         """
-        get the dagPath of influence object(joint) and Geometry components(vertex)
+        get the dagPath of the deformed shape and the components(vertex) of the skinCluster or of the region
         :return: dagPath, componnets
         """
-        # get dagPath and member components of skined shape
-        # the deformerSet pretty controls which vertex is deformed by the skinCluster
-        # the deformerSet will allows us to pull out that components(vertex) mobject that we need
-        fnSet = openmaya.MFnSet(self.fn.deformerSet())
-        members = openmaya.MSelectionList()
-        # the MSelectionList contains the vertex information in the deformerSet above
-        fnSet.getMembers(members, False)
-
-        dagPath = openmaya.MDagPath()
-        components = openmaya.MObject()
+        return self.weightsApi.getGeometryComponents(self.vertices)
 
-        # dagPath: dagPath of influence objects(joint)
-        # components: mesh components(vertex)
-        members.getDagPath(0, dagPath, components)
+    def __iterComponentBlocks(self, dagPath, components, blockSize=None):
+        """
+        Split the components into subsets of at most blockSize vertices
+        :param dagPath: path to object deformed by the skinCluster
+        :param components: mesh components(vertex) of the deformerSet
+        :param blockSize: int, vertices per subset, self.blockSize when None
+        :return: generator of (first row, block components, (rows done, total rows)),
+                 the rows follow the order of the components
+        """
+        blockSize = blockSize or self.blockSize
+        if not blockSize:
+            yield 0, components, (1, 1)
+            return
 
-        return dagPath, components
+        elements = self.weightsApi.getElements(dagPath, components)
+        for start in xrange(0, len(elements), blockSize):
+            end = min(start + blockSize, len(elements))
+            yield start, self.weightsApi.createComponent(elements[start:end]), (end, len(elements))
 
     def gatherInfluenceWeights(self, dagPath, components):
         """
-        get and store the weights of each influence object for same ordered components(vertex) in data['weights'] dictionary
+        get and store the weights of all influence objects as a (vertices x influences) matrix in data['weights']
+        and the influence names in the same column order in data['influences'].
+        When streaming in blocks the weights are stored as CSR arrays instead, so only one dense block is in memory
         :param dagPath:
         :param components: mesh components(vertex)
         :return: None
         """
-        # Gathers all the influence weights
-        weights = self.__getCurrentWeights(dagPath, components)
+        runSteps(self.__iterInfluenceWeights(dagPath, components))
 
-        influencePaths = openmaya.MDagPathArray()
-        # influencePaths is the fullPath of the object(joint)
-        numInfluences = self.fn.influenceObjects(influencePaths)
-        # weight size = number of components(vertex) * number of influenceObjects(joints)
-        numComponentsPerInfluence = weights.length() / numInfluences
+    def __iterInfluenceWeights(self, dagPath, components):
+        """
+        gatherInfluenceWeights one block of vertices at a time
+        :return: generator of (vertices done, total vertices) after every block
+        """
+        influenceNames, influenceTable = self.getInfluenceTable()
+        numInfluences = len(influenceNames)
+
+        # we want to store the weights by influence without the namespace so it is easier
+        # to import if the namespace is different
+        self.data['influences'] = [SkinCluster.removeNamespaceFromString(name) for name in influenceNames]
+
+        for key in ['weights', 'offsets', 'indices', 'values']:
+            self.data.pop(key, None)
+
+        if not self.blockSize:
+            # Gathers all the influence weights
+            # weight size = number of components(vertex) * number of influenceObjects(joints),
+            # so the flat array is already the row major (vertices x influences) matrix
+            weights = self.weightsApi.getWeights(dagPath, components)
+            self.data['weights'] = weights.reshape(-1, numInfluences)
+            self.data['vertexCount'] = self.data['weights'].shape[0]
+            yield 1, 1
+            return
 
-        for ii in range(influencePaths.length()):
-            influenceName = influencePaths[ii].partialPathName()
-            # we want to store the weights by influence without the namespace so it is easier
-            # to import if the namespace is different
-            influenceNameWithoutNamespace = SkinCluster.removeNamespaceFromString(influenceName)
-            # store the weight of each influence object(joint) for same ordered components(vertex)
-            self.data['weights'][influenceNameWithoutNamespace] = [weights[jj * numInfluences + ii] for jj in range(numComponentsPerInfluence)]
+        blocks = []
+        for start, blockComponents, progress in self.__iterComponentBlocks(dagPath, components):
+            weights = self.weightsApi.getWeights(dagPath, blockComponents).reshape(-1, numInfluences)
+            blocks.append(weightUtils.denseToSparse(weights))
+            yield progress
+
+        offsets, indices, values = weightUtils.concatenateSparse(blocks)
+        self.data['offsets'] = offsets
+        self.data['indices'] = indices
+        self.data['values'] = values
+        self.data['vertexCount'] = len(offsets) - 1
 
     def gatherBlendWeights(self, dagPath, components):
         """
@@ -284,36 +1829,48 @@ class SkinCluster(object):
         :param components: mesh components(vertex)
         :return: None
         """
-        weights = openmaya.MDoubleArray()
-        self.fn.getBlendWeights(dagPath, components, weights)
-        self.data['blendWeights'] = [weights[i] for i in range(weights.length())]
+        runSteps(self.__iterBlendWeights(dagPath, components))
 
-    def __getCurrentWeights(self, dagPath, components):
+    def __iterBlendWeights(self, dagPath, components):
         """
-        Get the current weights array. Be careful about the weight array, it is a giant single array.
-        The order of the weights array is dependent on the indices of the joint
-        :param dagPath: path to object deformed by the skinCluster
-        :param components: Components to return weight for, every single vertex in the mesh
-        :return: Weights
+        gatherBlendWeights one block of vertices at a time
+        :return: generator of (vertices done, total vertices) after every block
         """
-        weights = openmaya.MDoubleArray()
-        util = openmaya.MScriptUtil()
+        blocks = []
+        for start, blockComponents, progress in self.__iterComponentBlocks(dagPath, components):
+            blocks.append(self.weightsApi.getBlendWeights(dagPath, blockComponents))
+            yield progress
 
-        util.createFromInt(0)
+        self.data['blendWeights'] = np.concatenate(blocks) if blocks else np.zeros(0)
 
-        pUInt = util.asUintPtr()
-        # Gets the skinCluster weights for ALL influenceObjects(joints) for the specified components of the object whose dagPath is specified.
-        # More details see: https://download.autodesk.com/us/maya/2011help/API/class_m_fn_skin_cluster.html#82e83fc5ab653aa15c5431710b3ac86a
-        self.fn.getWeights(dagPath, components, weights, pUInt)
-        # weights is a giant single Double Array
-        # size = number of components(vertex) * number of influenceObjects(joints)
-        return weights
+    def exportSkin(self, filePath=None, sparse=True, compression=None, baseline=None, force=False,
+                   pruneBelow=0.0, maxInfluences=None, quantization=None, geometry=True):
+        """
+        Export the skinCluster data to disk, see exportSkinJob for the parameters
+        :return:
+        """
+        job = self.exportSkinJob(filePath, sparse, compression, baseline, force, pruneBelow, maxInfluences,
+                                 quantization, geometry)
+        if job:
+            job.run()
 
-    def exportSkin(self, filePath=None):
+    def exportSkinJob(self, filePath=None, sparse=True, compression=None, baseline=None, force=False,
+                      pruneBelow=0.0, maxInfluences=None, quantization=None, geometry=True):
         """
-        Export the skinCluster data to disk
+        Prepare the export of the skinCluster data, the weights are read block by block on the main thread
+        and written to disk by a threaded stage
         :param filePath: File Path
-        :return:
+        :param sparse: bool, store only the non zero weights in CSR arrays instead of the dense matrix
+        :param compression: str, 'zlib' or 'bz2' to compress the arrays in parallel blocks, None writes them raw
+        :param baseline: str, path of a previous export of this mesh, only the changed vertex blocks are written
+        :param force: bool, rewrite the file even if it already holds exactly these weights
+        :param pruneBelow: float, remove exported weights smaller than this and renormalize
+        :param maxInfluences: int, keep the largest weights of every vertex and renormalize
+        :param quantization: int, 8 or 16 to store the weights as uint8 or uint16 like the engine, importing
+                             the file previews the precision loss. None stores doubles
+        :param geometry: bool or 'points', store the positions and triangles used to transfer the weights,
+                         'points' only stores the positions for 'nearest' transfers, see gatherData
+        :return: SkinJob or None when no file is chosen
         """
         if filePath == None:
             startDir = cmds.workspace(q=1, rootDirectory=1)
@@ -322,82 +1879,239 @@ class SkinCluster(object):
 
         if not filePath:
             return
-
-        filePath = filePath[0]
+        if not isinstance(filePath, basestring):
+            filePath = filePath[0]
 
         if not filePath.endswith(SkinCluster.kFileExtension):
             filePath += SkinCluster.kFileExtension
 
-        self.gatherData()
+        def write():
+            if pruneBelow or maxInfluences:
+                self.data, numChanged = cleanSkinData(self.data, pruneBelow, maxInfluences)
+                job.log("Cleaned the weights of %d vertices" % numChanged)
+
+            written = writeSkinFile(filePath, self.data, sparse=sparse, compression=compression,
+                                    baseline=baseline, force=force, quantization=quantization, log=job.log)
+            if written is None:
+                job.log("Skipped unchanged skinCluster %s" % filePath)
+                return
+            job.log("Exported skinCluster (%d influences, %d of %d vertices) %s" % (len(self.data['influences']), written, self.data['vertexCount'], filePath))
+
+        job = SkinJob('Export %s' % self.node)
+        job.addStage('Reading the weights of %s' % self.shape, partial(self.iterGatherData, geometry))
+        job.addStage('Writing %s' % filePath, write, threaded=True)
+        return job
 
-        fh = open(filePath, 'wb')
-        pickle.dump(self.data, fh, pickle.HIGHEST_PROTOCOL)
+    def getContentHash(self, hashBlockSize=None):
+        """
+        Gather the current weights and hash them the same way as the header of an exported file
+        :param hashBlockSize: int, vertices per hashed block, must match the one of the compared file
+        :return: str, hex digest
+        """
+        self.gatherData(geometry=False)
+        return self.__hashData(hashBlockSize)
 
-        fh.close()
-        print "Exported skinCluster (%d influences, %d vertices) %s" % (len(self.data['weights'].keys()), len(self.data['blendWeights']), filePath)
+    def __hashData(self, hashBlockSize=None):
+        """
+        :param hashBlockSize: int, vertices per hashed block
+        :return: str, hex digest of the gathered weights
+        """
+        offsets, indices, values = getSparseWeights(self.data)
+        blockHashes = weightUtils.blockHashes(offsets, indices, values, self.data.get('blendWeights'),
+                                              hashBlockSize or SkinCluster.kHashBlockSize)
+        return getContentHash(self.data, blockHashes)
 
-    def setData(self, data):
+    def copyTo(self, targets):
+        """
+        Copy the weights, blendWeights and influences of this skinCluster straight to meshes of the same
+        topology, without writing a file. The weights are gathered once for all the targets.
+        A target without a skinCluster is bound to the same influences in one skinCluster call,
+        so its influence columns match and nothing is remapped
+        :param targets: str or list(str), shapes or transforms of the meshes, a region only copies its vertices
+        :return: list(str), the skinClusters of the targets
+        """
+        if isinstance(targets, basestring):
+            targets = [targets]
+
+        skinClusters = []
+        with lookupCache:
+            self.gatherData(geometry=False)
+            influenceNames, influenceTable = self.getInfluenceTable()
+
+            # check all the targets first, so a mismatch does not leave half of them copied
+            for target in targets:
+                fingerprint = SkinCluster.getGeometryFingerprint(target)
+                if not matchFingerprint(self.data['fingerprint'], fingerprint):
+                    raise RuntimeError('Geometry of %s does not match %s. %s != %s' % (target, self.shape, fingerprint,
+                                                                                     self.data['fingerprint']))
+
+            for target in targets:
+                created = not SkinCluster.getSkinCluster(target)
+                if created:
+                    name = '%s_skinCluster' % getShape(target).split('|')[-1]
+                    cmds.skinCluster(influenceNames, target, tsb=1, nw=2, n=name)
+
+                # the gathered arrays are shared by all the targets, nothing is copied per target
+                targetSkin = SkinCluster(target, blockSize=self.blockSize, vertices=self.vertices)
+                targetSkin.setData(self.data, force=True, created=created)
+                skinClusters.append(targetSkin.node)
+                print "Copied %s to %s (%d vertices)" % (self.node, targetSkin.node, self.data['vertexCount'])
+
+        return skinClusters
+
+    def setData(self, data, force=False, mapping=None, strategies=None, interactive=False, created=False):
         """
         Sets the data and stores it in the Maya skinCluster node.
+        :param data: dict, skin data
+        :param force: bool, set the weights even if the skinCluster already holds exactly these weights
+        :param mapping: dict or str json file path, see remapInfluences
+        :param strategies: list(str), see remapInfluences
+        :param interactive: bool, see remapInfluences
+        :param created: bool, the skinCluster was just created, undoing its creation removes the weights
+                        so the weights before are not snapshotted
         :return:
         """
-        self.data = data
+        runSteps(self.iterSetData(data, force, mapping, strategies, interactive, created))
+
+    def iterSetData(self, data, force=False, mapping=None, strategies=None, interactive=False, created=False):
+        """
+        setData one block of vertices at a time, see setData for the parameters
+        :return: generator of (vertices done, total vertices) after every block
+        """
+        # reading the weights is much cheaper than setting them and filling the undo queue
+        if not force and data.get('contentHash') and data.get('hashBlockSize'):
+            for progress in self.iterGatherData(geometry=False):
+                yield progress
+            if self.__hashData(data['hashBlockSize']) == data['contentHash']:
+                print "%s already has these weights, skipped" % self.node
+                return
+
+        self.data = upgradeData(data)
         dagPath, components = self.__getGeometryComponents()
-        self.setInfluenceWeights(dagPath, components)
-        self.setBlendWeights(dagPath, components)
+
+        # the weights before and after the import, only of the vertices and influences which are set
+        snapshots = None
+        if skinUndo is not None and SkinCluster.kUndoBudget and cmds.undoInfo(q=1, state=1):
+            snapshots = (None if created else WeightSnapshot(self.shape), WeightSnapshot(self.shape))
+
+        try:
+            for progress in self.__iterSetInfluenceWeights(dagPath, components, mapping, strategies, interactive,
+                                                           snapshots):
+                yield progress
+            if 'blendWeights' in self.data:
+                for progress in self.__iterSetBlendWeights(dagPath, components, snapshots):
+                    yield progress
+        except (GeneratorExit, Exception):
+            # a cancelled or failed import puts back the weights of the blocks already set
+            if snapshots and snapshots[0]:
+                snapshots[0].restore()
+            raise
+
+        if snapshots:
+            before, after = snapshots
+            if before:
+                skinUndo.commit(before.restore, after.restore)
+                keepUndoSnapshots(before, after)
+            else:
+                # redo creates the skinCluster again before the weights are restored
+                skinUndo.commit(lambda: None, after.restore)
+                keepUndoSnapshots(after)
 
         for attr in ['skinningMethod', 'normalizeWeights']:
             cmds.setAttr('%s.%s' % (self.node, attr), self.data[attr])
 
-    def setInfluenceWeights(self, dagPath, components):
+    def setInfluenceWeights(self, dagPath, components, mapping=None, strategies=None, interactive=False):
         """
-
+        Store the imported weight columns in the matching influences with one setWeights call per block,
+        only the matched influences are written so the current weights are never read
         :param dagPath:
         :param components:
+        :param mapping: dict or str json file path, see remapInfluences
+        :param strategies: list(str), see remapInfluences
+        :param interactive: bool, see remapInfluences
         :return:
         """
-        # get the existing weights and fill in the new weights
-        weights = self.__getCurrentWeights(dagPath, components)
-        influencePaths = openmaya.MDagPathArray()
-        numInfluences = self.fn.influenceObjects(influencePaths)
-        numComponentsPerInfluence = weights.length() / numInfluences
+        runSteps(self.__iterSetInfluenceWeights(dagPath, components, mapping, strategies, interactive))
+
+    def __iterSetInfluenceWeights(self, dagPath, components, mapping=None, strategies=None, interactive=False,
+                                  snapshots=None):
+        """
+        setInfluenceWeights one block of vertices at a time
+        :param snapshots: (WeightSnapshot or None, WeightSnapshot), receive the weights before and after every block
+        :return: generator of (vertices done, total vertices) after every block
+        """
+        existingInfluences, influenceTable = self.getInfluenceTable()
 
         # Keep track of which imported influences aren't used
         unusedImports = []
+        # column indices of the imported matrix and the matching columns of the current matrix
+        srcColumns = []
+        dstColumns = []
+
+        for src, importedInfluence in enumerate(self.data['influences']):
+            dst = influenceTable.get(importedInfluence)
+            if dst is None:
+                unusedImports.append(importedInfluence)
+            else:
+                srcColumns.append(src)
+                dstColumns.append(dst)
+
         # Keep track of which existing influences don't get anything imported
-        noMatch = [influencePaths[ii].partialPathName() for ii in xrange(influencePaths.length())]
+        matched = set(dstColumns)
+        noMatch = [name for ii, name in enumerate(existingInfluences) if ii not in matched]
 
-        for importedInfluence, importedWeights in self.data['weights'].items():
-            for inf_count in xrange(influencePaths.length()):
-                # partialPathName used to return exclusive partial path name of the object
-                influenceName = influencePaths[inf_count].partialPathName()
-                influenceWithoutNamespace = SkinCluster.removeNamespaceFromString(influenceName)
+        if unusedImports and noMatch:
+            remapped = SkinCluster.remapInfluences(unusedImports, noMatch, mapping, strategies, interactive)
 
-                if influenceWithoutNamespace == importedInfluence:
-                    # Store the imported weights into the MDoubeArray
-                    for jj in xrange(numComponentsPerInfluence):
-                        weights.set(importedWeights[jj], jj * numInfluences + inf_count)
+            importTable = dict((name, ii) for ii, name in enumerate(self.data['influences']))
+            for src, dst in remapped.items():
+                srcColumns.append(importTable[src])
+                dstColumns.append(influenceTable[SkinCluster.removeNamespaceFromString(dst)])
 
-                    noMatch.remove(influenceName)
-                    break
-            else:
-                unusedImports.append(importedInfluence)
+        if not dstColumns:
+            print "No influence of %s matches the imported influences" % self.node
+            return
 
-        if unusedImports and noMatch:
-            mappingDialog = WeightRemapDialog(getMayaWindow())
-            mappingDialog.setInfluences(unusedImports, noMatch)
-            mappingDialog.exec_()
-            for src, dst in mappingDialog.mapping.items():
-                for ii in range(influencePaths.length()):
-                    if influencePaths[ii].partialPathName() == dst:
-                        for jj in range(numComponentsPerInfluence):
-                            weights.set(self.data['weights'][src][jj], jj*numInfluences+ii)
-                        break
-
-        influenceIndics = openmaya.MIntArray(numInfluences)
-        for ii in range(numInfluences):
-            influenceIndics.set(ii, ii)
-        self.fn.setWeights(dagPath, components, influenceIndics, weights, False)
+        numRows = len(self.data['offsets']) - 1 if 'values' in self.data else len(self.data['weights'])
+        dstColumns = np.array(dstColumns, dtype=np.int64)
+        blockSize = self.blockSize or SkinCluster.kSetBlockSize
+        for start, blockComponents, progress in self.__iterComponentBlocks(dagPath, components, blockSize):
+            end = min(start + blockSize, numRows)
+            weights = self.__getImportedWeights(start, end, srcColumns)
+            if snapshots:
+                elements = self.weightsApi.getElements(dagPath, blockComponents)
+                if snapshots[0]:
+                    current = self.weightsApi.getWeights(dagPath, blockComponents, dstColumns)
+                    snapshots[0].addWeights(elements, dstColumns, current.reshape(-1, len(dstColumns)))
+                snapshots[1].addWeights(elements, dstColumns, weights)
+            self.weightsApi.setWeights(dagPath, blockComponents, dstColumns, weights)
+            yield progress
+
+    def __getImportedWeights(self, start, end, srcColumns):
+        """
+        Get the imported weights of the rows start:end in the matched columns
+        :param start: int, first row of the block in the imported data
+        :param end: int, end row of the block
+        :param srcColumns: list(int), columns of the imported influences
+        :return: numpy.ndarray, (block vertices x len(srcColumns)) weights
+        """
+        if 'values' not in self.data:
+            # copy all matched columns at once
+            return np.ascontiguousarray(self.data['weights'][start:end, srcColumns])
+
+        # scatter the stored non zero weights, cost scales with the number of non zero weights
+        columnMap = np.full(len(self.data['influences']), -1, dtype=np.int64)
+        columnMap[srcColumns] = np.arange(len(srcColumns))
+
+        offsets = self.data['offsets'][start:end + 1]
+        columns = columnMap[self.data['indices'][offsets[0]:offsets[-1]]]
+        values = self.data['values'][offsets[0]:offsets[-1]]
+        rows = weightUtils.sparseRows(offsets)
+        matched = columns >= 0
+
+        weights = np.zeros((end - start, len(srcColumns)), dtype=np.float64)
+        weights[rows[matched], columns[matched]] = values[matched]
+        return weights
 
     def setBlendWeights(self, dagPath, components):
         """
@@ -406,11 +2120,75 @@ class SkinCluster(object):
         :param components:
         :return:
         """
-        blendWeights = openmaya.MDoubleArray(len(self.data['blendWeights']))
-        for i, w in enumerate(self.data['blendWeights']):
-            blendWeights.set(w, i)
+        runSteps(self.__iterSetBlendWeights(dagPath, components))
+
+    def __iterSetBlendWeights(self, dagPath, components, snapshots=None):
+        """
+        setBlendWeights one block of vertices at a time
+        :param snapshots: (WeightSnapshot or None, WeightSnapshot), receive the blendWeights before and after every block
+        :return: generator of (vertices done, total vertices) after every block
+        """
+        blockSize = self.blockSize or SkinCluster.kSetBlockSize
+        for start, blockComponents, progress in self.__iterComponentBlocks(dagPath, components, blockSize):
+            blendWeights = self.data['blendWeights'][start:start + blockSize]
+            if snapshots:
+                elements = self.weightsApi.getElements(dagPath, blockComponents)
+                if snapshots[0]:
+                    snapshots[0].addBlendWeights(elements, self.weightsApi.getBlendWeights(dagPath, blockComponents))
+                snapshots[1].addBlendWeights(elements, blendWeights)
+            self.weightsApi.setBlendWeights(dagPath, blockComponents, blendWeights)
+            yield progress
+
+
+class InfluenceMappingModel(QtCore.QAbstractTableModel):
+    """
+    table model of the imported influences and the influence each one is mapped to,
+    views only ask for the visible rows so it stays fast with hundreds of influences
+    """
+    kHeaders = ['Imported influence', 'Mapped to']
+
+    def __init__(self, influences, mapping, parent=None):
+        """
+        :param influences: list(str), imported influences, one per row
+        :param mapping: dict, {imported influence: existing influence}, edited in place
+        """
+        super(InfluenceMappingModel, self).__init__(parent)
+        self.influences = list(influences)
+        self.mapping = mapping
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.influences)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.kHeaders)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        influence = self.influences[index.row()]
+        if index.column() == 0:
+            return influence
+        return self.mapping.get(influence, '')
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.kHeaders[section]
+        return None
+
+    def setMapping(self, row, target):
+        """
+        :param row: int, row of the imported influence
+        :param target: str, existing influence, None removes the mapping
+        :return: str, the existing influence the row was mapped to before, or None
+        """
+        influence = self.influences[row]
+        previous = self.mapping.pop(influence, None)
+        if target:
+            self.mapping[influence] = target
 
-        self.fn.setBlendWeights(dagPath, components, blendWeights)
+        index = self.index(row, 1)
+        self.dataChanged.emit(index, index)
+        return previous
 
 
 class WeightRemapDialog(QtWidgets.QDialog):
@@ -428,8 +2206,9 @@ class WeightRemapDialog(QtWidgets.QDialog):
 
         self.setLayout(self.mainVbox)
 
-        label = QtWidgets.QLabel('The following influences have no corresponding influence from the import file. '
-                                 'You can either remap the influences or skip them')
+        label = QtWidgets.QLabel('The following imported influences have no corresponding influence. '
+                                 'Select an imported influence and an available influence to remap it, '
+                                 'or skip them')
 
         label.setWordWrap(True)
 
@@ -438,74 +2217,266 @@ class WeightRemapDialog(QtWidgets.QDialog):
         self.HBox = QtWidgets.QHBoxLayout()
         self.mainVbox.addLayout(self.HBox)
 
+        # both views are item views, only the visible rows are created
+        vbox = QtWidgets.QVBoxLayout()
+        self.HBox.addLayout(vbox)
+        vbox.addWidget(QtWidgets.QLabel('Imported influences'))
+        self.importedView = QtWidgets.QTableView()
+        self.importedView.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.importedView.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.importedView.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.importedView.verticalHeader().hide()
+        self.importedView.horizontalHeader().setStretchLastSection(True)
+        vbox.addWidget(self.importedView)
 
         self.VBox = QtWidgets.QVBoxLayout()
         self.HBox.addLayout(self.VBox)
-
-        self.VBox.addWidget(QtWidgets.QLabel('Unmapped influences'))
-
-        self.existingInfluences = QtWidgets.QListWidget()
+        self.VBox.addWidget(QtWidgets.QLabel('Available influences'))
+        self.filterLineEdit = QtWidgets.QLineEdit()
+        self.filterLineEdit.setPlaceholderText('Filter')
+        self.VBox.addWidget(self.filterLineEdit)
+
+        self.existingModel = QtCore.QStringListModel()
+        self.existingProxy = QtCore.QSortFilterProxyModel()
+        self.existingProxy.setSourceModel(self.existingModel)
+        self.existingProxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+        self.filterLineEdit.textChanged.connect(self.existingProxy.setFilterFixedString)
+
+        self.existingInfluences = QtWidgets.QListView()
+        self.existingInfluences.setUniformItemSizes(True)
+        self.existingInfluences.setModel(self.existingProxy)
+        self.existingInfluences.doubleClicked.connect(self.setInfluencesMapping)
         self.VBox.addWidget(self.existingInfluences)
 
-        vbox = QtWidgets.QVBoxLayout()
-        self.HBox.addLayout(vbox)
-        vbox.addWidget(QtWidgets.QLabel('Available imported influence'))
-        self.scrollArea = QtWidgets.QScrollArea()
-        self.widget = QtWidgets.QScrollArea()
-        self.importedInfluenceLayout = QtWidgets.QVBoxLayout(self.widget)
-        vbox.addWidget(self.widget)
-
         hbox = QtWidgets.QHBoxLayout()
         self.mainVbox.addLayout(hbox)
+        self.mapBtn = QtWidgets.QPushButton('<- Map')
+        self.mapBtn.released.connect(self.setInfluencesMapping)
+        hbox.addWidget(self.mapBtn)
+        self.unmapBtn = QtWidgets.QPushButton('Unmap')
+        self.unmapBtn.released.connect(self.removeInfluencesMapping)
+        hbox.addWidget(self.unmapBtn)
         hbox.addStretch()
         self.btn = QtWidgets.QPushButton('OK')
         self.btn.released.connect(self.accept)
         hbox.addWidget(self.btn)
 
-    def setInfluences(self, importedInfluences, existingInfluences):
-        infs = list(existingInfluences)
-        infs.sort()
-        self.existingInfluences.addItems(infs)
+    def setInfluences(self, importedInfluences, existingInfluences, suggestions=None):
+        """
+        :param importedInfluences: list(str), unmatched imported influences
+        :param existingInfluences: list(str), existing influences which can receive their weights
+        :param suggestions: dict, {imported influence: existing influence} already matched, the user can change them
+        :return: None
+        """
+        self.mapping = dict(suggestions or {})
+        self.importedModel = InfluenceMappingModel(sorted(importedInfluences), self.mapping, self)
+        self.importedView.setModel(self.importedModel)
+
+        used = set(self.mapping.values())
+        self.existingModel.setStringList(sorted(x for x in existingInfluences if x not in used))
+
+    def selectedImportedRow(self):
+        """
+        :return: int, selected row of the imported influences or None
+        """
+        rows = self.importedView.selectionModel().selectedRows()
+        return rows[0].row() if rows else None
+
+    def setInfluencesMapping(self, *args):
+        """
+        Map the selected imported influence to the selected available influence
+        :return: None
+        """
+        row = self.selectedImportedRow()
+        selected = self.existingInfluences.selectionModel().selectedIndexes()
+        if row is None or not selected:
+            return
+
+        available = self.existingModel.stringList()
+        dst = self.existingProxy.data(selected[0])
+        available.remove(dst)
+
+        previous = self.importedModel.setMapping(row, dst)
+        if previous:
+            available.append(previous)
+        self.existingModel.setStringList(sorted(available))
 
-        width = 200
-        for inf in importedInfluences:
-            row = QtWidgets.QHBoxLayout()
-            self.importedInfluenceLayout.addLayout(row)
+        # continue with the next imported influence
+        if row + 1 < self.importedModel.rowCount():
+            self.importedView.selectRow(row + 1)
 
-            label = QtWidgets.QLabel(inf)
-            row.addWidget(label)
+    def removeInfluencesMapping(self):
+        """
+        Skip the selected imported influence, its target is available again
+        :return: None
+        """
+        row = self.selectedImportedRow()
+        if row is None:
+            return
 
-            toggleBtn = QtWidgets.QPushButton('->')
-            toggleBtn.setMaximumWidth(30)
-            row.addWidget(toggleBtn)
+        previous = self.importedModel.setMapping(row, None)
+        if previous:
+            self.existingModel.setStringList(sorted(self.existingModel.stringList() + [previous]))
 
-            label = QtWidgets.QLabel('')
-            label.setMaximumWidth(width)
-            label.setSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
-            row.addWidget(label)
 
-            toggleBtn.released.connect(partial(self.setInfluencesMapping, src=inf, label=label))
+class SkinJobDialog(QtWidgets.QProgressDialog):
+    """
+    Progress dialog running a SkinJob while the UI stays usable, the threaded stages run on a worker thread
+    and the Maya stages run one block per event loop iteration, so the cancel button is handled between blocks
+    """
+    # milliseconds between two checks of a running worker thread
+    kPollInterval = 50
+
+    def __init__(self, job, parent=None):
+        super(SkinJobDialog, self).__init__(job.title, 'Cancel', 0, 1000, parent)
+
+        self.setWindowTitle(job.title)
+        self.setObjectName('skinJobDialog')
+        self.setWindowModality(QtCore.Qt.NonModal)
+        self.setMinimumDuration(0)
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+
+        self.job = job
+        self.stageIndex = -1
+        # generator of the running main thread stage
+        self.steps = None
+        # thread of the running threaded stage and the sys.exc_info of its error
+        self.worker = None
+        self.workerError = None
+        self.stopped = False
+        # a step can open a modal dialog, like the influence remap, whose event loop fires the timer again
+        self.stepping = False
+        self.cancelRequested = False
+
+        self.canceled.connect(self.cancelJob)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.step)
 
-        self.importedInfluenceLayout.addStretch()
+    @classmethod
+    def start(cls, job, parent=None):
+        """
+        :param job: SkinJob, nothing is started when None
+        :param parent: QWidget, the Maya main window when None
+        :return: SkinJobDialog or None
+        """
+        if job is None:
+            return None
 
+        dialog = cls(job, parent or getMayaWindow())
+        dialog.show()
+        dialog.timer.start(0)
+        return dialog
 
-    def setInfluencesMapping(self, src, label):
-        selectedInfluence = self.existingInfluences.selectedItems()
+    def step(self):
+        """
+        Run one block of the current stage or start the next stage, called by the timer
+        :return: None
+        """
+        if self.stepping or self.stopped:
+            return
 
-        if not selectedInfluence:
+        self.stepping = True
+        try:
+            if self.worker is not None:
+                # wait for the pure python stage without blocking the event loop
+                if self.worker.is_alive():
+                    return
+                self.worker = None
+                self.job.printMessages()
+                if self.workerError is not None:
+                    raise self.workerError[0], self.workerError[1], self.workerError[2]
+                self.nextStage()
+            elif self.steps is not None:
+                try:
+                    self.setStageProgress(*next(self.steps))
+                except StopIteration:
+                    self.nextStage()
+            else:
+                self.nextStage()
+        except Exception:
+            self.finish()
+            raise
+        finally:
+            self.stepping = False
+
+        # the cancel button was pressed while the step ran
+        if self.cancelRequested:
+            self.cancelJob()
+
+    def nextStage(self):
+        """
+        Start the next stage of the job, or finish when the job is done or cancelled
+        :return: None
+        """
+        self.stageIndex += 1
+        self.steps = None
+        if self.job.cancelled or self.stageIndex == len(self.job.stages):
+            self.finish()
             return
 
-        dst = selectedInfluence[0].text()
+        label, function, threaded = self.job.stages[self.stageIndex]
+        self.setLabelText(label)
+        self.setStageProgress(0, 1)
+        if threaded:
+            self.workerError = None
+            self.worker = threading.Thread(target=self.runWorker, args=(function,))
+            self.worker.daemon = True
+            self.worker.start()
+            self.timer.setInterval(SkinJobDialog.kPollInterval)
+        else:
+            self.steps = function()
+            self.timer.setInterval(0)
 
-        label.setText(dst)
+    def runWorker(self, function):
+        """
+        Run a threaded stage on the worker thread, its error is raised again on the main thread
+        :return: None
+        """
+        try:
+            runSteps(function())
+        except Exception:
+            self.workerError = sys.exc_info()
 
-        self.mapping[src] = dst
+    def setStageProgress(self, done, total):
+        """
+        :param done: int, vertices done of the current stage
+        :param total: int, vertices of the current stage
+        :return: None
+        """
+        fraction = float(done) / total if total else 1.0
+        self.setValue(int(self.maximum() * (self.stageIndex + fraction) / len(self.job.stages)))
 
-        index = self.existingInfluences.indexFromItem(selectedInfluence[0])
+    def cancelJob(self):
+        """
+        Stop the job after the current block, a running worker thread can not be interrupted,
+        the job stops when it is done
+        :return: None
+        """
+        if self.stopped:
+            return
+        if self.stepping:
+            # the generator of the stage is running, it is closed after the step
+            self.cancelRequested = True
+            return
 
-        item = self.existingInfluences.takeItem(index.row())
+        if self.steps is not None:
+            self.steps.close()
+            self.steps = None
+        self.job.cancel()
+        if self.worker is None:
+            self.finish()
 
-        del item
+    def finish(self):
+        """
+        Stop the timer and close the dialog
+        :return: None
+        """
+        self.stopped = True
+        self.timer.stop()
+        self.job.printMessages()
+        self.close()
 
 
 class SkinIODialog(QtWidgets.QDialog):
@@ -516,15 +2487,59 @@ class SkinIODialog(QtWidgets.QDialog):
         self.setWindowTitle('Skin IO')
         self.setObjectName('skinioWidget')
         self.setModal(False)
-        self.setFixedSize(200, 80)
+        self.setFixedSize(200, 110)
 
         self.vbox = QtWidgets.QVBoxLayout()
         self.setLayout(self.vbox)
 
         self.exportBtn = QtWidgets.QPushButton("Export")
         self.vbox.addWidget(self.exportBtn)
-        self.exportBtn.clicked.connect(SkinCluster.export)
+        self.exportBtn.clicked.connect(lambda: SkinCluster.exportAsync())
 
         self.importBtn = QtWidgets.QPushButton("Import")
         self.vbox.addWidget(self.importBtn)
-        self.importBtn.clicked.connect(SkinCluster.createAndImport)
+        # the user is there to map the influences which do not match
+        self.importBtn.clicked.connect(lambda: SkinCluster.importAsync(interactive=True))
+
+        self.reportBtn = QtWidgets.QPushButton("Report")
+        self.vbox.addWidget(self.reportBtn)
+        self.reportBtn.clicked.connect(self.showReport)
+
+    def showReport(self):
+        """
+        Show the report of the selected shape, or of a .skin file when nothing is selected
+        :return: None
+        """
+        source = None
+        if not cmds.ls(sl=1):
+            startDir = cmds.workspace(q=1, rootDirectory=1)
+            source = cmds.fileDialog2(dialogStyle=2, fileMode=1, startingDirectory=startDir,
+                                      fileFilter='Skin Files (*%s)' % SkinCluster.kFileExtension)
+            if not source:
+                return
+            source = source[0]
+
+        text = formatSkinReport(getSkinReport(source))
+        print text
+
+        dialog = SkinReportDialog(text, self)
+        dialog.show()
+
+
+class SkinReportDialog(QtWidgets.QDialog):
+    def __init__(self, text, parent=None):
+        super(SkinReportDialog, self).__init__(parent)
+
+        self.setWindowTitle('Skin Report')
+        self.setObjectName('skinReportWidget')
+        self.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        self.resize(480, 400)
+
+        self.vbox = QtWidgets.QVBoxLayout()
+        self.setLayout(self.vbox)
+
+        self.textEdit = QtWidgets.QPlainTextEdit()
+        self.textEdit.setReadOnly(True)
+        self.textEdit.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.textEdit.setPlainText(text)
+        self.vbox.addWidget(self.textEdit)
@@ -0,0 +1,89 @@
+"""
+skinUndo @ skinLib
+
+Put python undo and redo functions on the Maya undo queue. The weights set through MFnSkinCluster
+are not undoable by themselves, so skinLib snapshots them and commits the restore functions here:
+    skinUndo.commit(before.restore, after.restore)
+This file is also the Maya plugin of the skinLibUndo command which holds the functions on the queue,
+it is loaded by commit on first use.
+"""
+
+import os
+import sys
+import types
+
+import maya.cmds as cmds
+import maya.api.OpenMaya as openmaya2
+
+kCommandName = 'skinLibUndo'
+kPluginName = 'skinUndo'
+
+
+def maya_useNewAPI():
+    """
+    The plugin uses the python API 2.0
+    """
+    pass
+
+
+def getShared():
+    """
+    Maya loads the plugin file as a module of its own, the pending functions are handed over
+    through a module both copies share
+    :return: module, with the list 'pending' of (undo, redo) functions
+    """
+    shared = sys.modules.get('_skinUndoShared')
+    if shared is None:
+        shared = sys.modules['_skinUndoShared'] = types.ModuleType('_skinUndoShared')
+        shared.pending = []
+    return shared
+
+
+def commit(undo, redo):
+    """
+    Put a change made outside of Maya commands on the undo queue, the change is already done
+    :param undo: callable without arguments, reverts the change
+    :param redo: callable without arguments, makes the change again
+    :return: None
+    """
+    if not cmds.pluginInfo(kPluginName, q=1, loaded=1):
+        cmds.loadPlugin(os.path.splitext(os.path.abspath(__file__))[0] + '.py', quiet=True)
+
+    getShared().pending.append((undo, redo))
+    getattr(cmds, kCommandName)()
+
+
+class SkinUndoCommand(openmaya2.MPxCommand):
+    """
+    command holding one pair of undo and redo functions on the undo queue, the snapshots the functions
+    are bound to are freed with the command when Maya flushes the queue
+    """
+
+    def __init__(self):
+        super(SkinUndoCommand, self).__init__()
+        self.undo = None
+        self.redo = None
+
+    def doIt(self, args):
+        self.undo, self.redo = getShared().pending.pop()
+
+    def undoIt(self):
+        self.undo()
+
+    def redoIt(self):
+        self.redo()
+
+    def isUndoable(self):
+        return True
+
+    @staticmethod
+    def creator():
+        return SkinUndoCommand()
+
+
+def initializePlugin(plugin):
+    openmaya2.MFnPlugin(plugin).registerCommand(kCommandName, SkinUndoCommand.creator)
+
+
+def uninitializePlugin(plugin):
+    openmaya2.MFnPlugin(plugin).deregisterCommand(kCommandName)
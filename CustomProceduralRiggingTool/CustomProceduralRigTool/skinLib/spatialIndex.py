@@ -0,0 +1,403 @@
+"""
+spatialIndex @ skinLib
+
+Vectorized spatial queries on point clouds and triangle meshes, used to move weights between meshes
+that do not share their topology. All queries run as whole-array numpy operations, there is no
+per vertex python loop.
+"""
+
+import itertools
+import numpy as np
+
+# cell size ratio between a grid and the coarser grid searched for the queries far from every point
+kCoarseFactor = 8
+# a coarser grid is only used while its occupied cells hold fewer points than this on average,
+# the remaining far queries are compared against all the points
+kMaxCoarsePointsPerCell = 256
+# number of (query, point) distances compared at once by the brute force search
+kBruteForcePairs = 1 << 22
+
+
+def shellOffsets(radius):
+    """
+    Get the cell offsets at exactly the given Chebyshev distance from a cell
+    :param radius: int, ring radius in cells
+    :return: numpy.ndarray, (offsets x 3) int64
+    """
+    cells = np.array(list(itertools.product(range(-radius, radius + 1), repeat=3)), dtype=np.int64)
+    return cells[np.abs(cells).max(axis=1) == radius]
+
+
+def firstPerGroup(groups, distances):
+    """
+    Get the position of the smallest distance of every group
+    :param groups: numpy.ndarray, group id of every candidate
+    :param distances: numpy.ndarray, distance of every candidate
+    :return: (unique groups, position of their closest candidate)
+    """
+    order = np.lexsort((distances, groups))
+    unique, first = np.unique(groups[order], return_index=True)
+    return unique, order[first]
+
+
+class SpatialHash(object):
+    """
+    class for nearest point queries, the points are bucketed in a uniform grid
+    """
+
+    def __init__(self, points, cellSize=None, pointsPerCell=2.0):
+        """
+        build the grid
+        :param points: numpy.ndarray, (points x 3) positions
+        :param cellSize: float, edge length of a cell, picked from the point distribution when None
+        :param pointsPerCell: float, average number of points per occupied cell used to pick the cell size
+        """
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(self.points):
+            raise ValueError('Can not build a spatial index without points')
+
+        self.minimum = self.points.min(axis=0)
+        self.extent = self.points.max(axis=0) - self.minimum
+
+        self.cellSize = float(cellSize or self.__pickCellSize(pointsPerCell))
+        self.__build()
+        # grid of larger cells for the far queries, built on first use, False when it would not prune enough
+        self.coarse = None
+
+    def __pickCellSize(self, pointsPerCell):
+        """
+        Pick a cell size so the occupied cells hold about pointsPerCell points.
+        Mesh vertices lie on a surface, most of the cells of the bounding box are empty,
+        so the size is refined from the occupancy of the grid instead of the bounding box volume
+        :param pointsPerCell: float
+        :return: float, cell size
+        """
+        size = self.extent[self.extent > 0]
+        if not len(size):
+            return 1.0
+
+        cellSize = (np.prod(size) * pointsPerCell / len(self.points)) ** (1.0 / len(size))
+        for ii in range(8):
+            self.cellSize = cellSize
+            self.__build()
+            occupied = len(self.occupiedKeys) if self.occupiedKeys is not None else \
+                np.count_nonzero(np.diff(self.cellStarts))
+            average = len(self.points) / float(occupied)
+            if average < pointsPerCell * 2:
+                break
+            # occupied cells of a surface grow with the square of 1 / cellSize
+            cellSize *= np.sqrt(pointsPerCell / average)
+
+        return cellSize
+
+    def __build(self):
+        """
+        bucket the points in cells of cellSize
+        :return: None
+        """
+        self.dimensions = np.floor(self.extent / self.cellSize).astype(np.int64) + 1
+        keys = self.cellKeys(self.cellCoordinates(self.points))
+
+        self.order = np.argsort(keys, kind='mergesort')
+        self.keys = keys[self.order]
+        # the points of a cell are contiguous, so the queries of a cell read one block of memory
+        self.sortedPoints = self.points[self.order]
+
+        # cells are found by their key in the occupied cells, or directly in a table of all the
+        # cells when the grid is small enough
+        numCells = int(np.prod(self.dimensions))
+        if numCells <= max(4 * len(self.points), 1 << 22):
+            self.cellStarts = np.zeros(numCells + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.keys, minlength=numCells), out=self.cellStarts[1:])
+            self.occupiedKeys = None
+        else:
+            self.occupiedKeys, first = np.unique(self.keys, return_index=True)
+            self.cellStarts = np.append(first, len(self.keys)).astype(np.int64)
+
+    def findCells(self, keys):
+        """
+        :param keys: numpy.ndarray, int64 cell keys
+        :return: (numpy.ndarray first position of each cell in order, numpy.ndarray number of points in each cell)
+        """
+        if self.occupiedKeys is None:
+            starts = self.cellStarts[keys]
+            return starts, self.cellStarts[keys + 1] - starts
+
+        positions = np.searchsorted(self.occupiedKeys, keys)
+        positions[positions == len(self.occupiedKeys)] = 0
+        found = self.occupiedKeys[positions] == keys
+        starts = self.cellStarts[positions]
+        counts = np.where(found, self.cellStarts[positions + 1] - starts, 0)
+        return starts, counts
+
+    def cellCoordinates(self, points):
+        """
+        :param points: numpy.ndarray, (points x 3) positions
+        :return: numpy.ndarray, (points x 3) int64 cell coordinates, may be outside of the grid
+        """
+        return np.floor((points - self.minimum) / self.cellSize).astype(np.int64)
+
+    def cellKeys(self, cells):
+        """
+        :param cells: numpy.ndarray, (cells x 3) cell coordinates inside of the grid
+        :return: numpy.ndarray, int64 key of every cell
+        """
+        return (cells[:, 0] * self.dimensions[1] + cells[:, 1]) * self.dimensions[2] + cells[:, 2]
+
+    def __searchCells(self, queries, cells, offsets, indices, distances):
+        """
+        Compare the queries with the points of the cells at the given offsets and keep the closest point
+        :param queries: numpy.ndarray, (queries x 3) positions
+        :param cells: numpy.ndarray, (queries x 3) cell of every query
+        :param offsets: numpy.ndarray, (offsets x 3) cell offsets to visit
+        :param indices: numpy.ndarray, position in sortedPoints of the closest point found so far, updated in place
+        :param distances: numpy.ndarray, squared distance to it, updated in place
+        :return: None
+        """
+        for offset in offsets:
+            neighbours = cells + offset
+            inside = np.nonzero(np.all((neighbours >= 0) & (neighbours < self.dimensions), axis=1))[0]
+            if not len(inside):
+                continue
+
+            starts, counts = self.findCells(self.cellKeys(neighbours[inside]))
+            occupied = counts > 0
+            inside, starts, counts = inside[occupied], starts[occupied], counts[occupied]
+            if not len(inside):
+                continue
+
+            # expand every (query, cell) into one pair per point of the cell,
+            # the pairs of a query are contiguous so they reduce with reduceat
+            groupStarts = np.cumsum(counts) - counts
+            total = groupStarts[-1] + counts[-1]
+            groups = np.repeat(np.arange(len(inside)), counts)
+            pointIndices = starts[groups] + np.arange(total, dtype=np.int64) - groupStarts[groups]
+
+            delta = self.sortedPoints[pointIndices] - queries[inside[groups]]
+            pairDistances = np.einsum('ij,ij->i', delta, delta)
+            closestDistances = np.minimum.reduceat(pairDistances, groupStarts)
+
+            # any of the tied closest points will do
+            closest = np.nonzero(pairDistances == closestDistances[groups])[0]
+            closestPoints = np.empty(len(inside), dtype=np.int64)
+            closestPoints[groups[closest]] = pointIndices[closest]
+
+            better = closestDistances < distances[inside]
+            distances[inside[better]] = closestDistances[better]
+            indices[inside[better]] = closestPoints[better]
+
+    def nearest(self, queries, chunkSize=65536, maxRadius=4):
+        """
+        Find the nearest point of every query point
+        :param queries: numpy.ndarray, (queries x 3) positions
+        :param chunkSize: int, number of queries processed at once, bounds the memory of the candidate pairs
+        :param maxRadius: int, queries without a result after searching this many rings of cells are
+                          searched again in a grid of kCoarseFactor times larger cells
+        :return: (numpy.ndarray int64 nearest point index, numpy.ndarray float64 distance)
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float64).reshape(-1, 3)
+        indices = np.full(len(queries), -1, dtype=np.int64)
+        distances = np.full(len(queries), np.inf)
+
+        # process the queries in cell order so neighbouring queries visit the same cells
+        cells = self.cellCoordinates(queries)
+        clamped = np.clip(cells, 0, self.dimensions - 1)
+        queryOrder = np.argsort(self.cellKeys(clamped), kind='mergesort')
+        queries = queries[queryOrder]
+        allCells = cells[queryOrder]
+        far = []
+
+        for start in xrange(0, len(queries), chunkSize):
+            chunk = slice(start, min(start + chunkSize, len(queries)))
+            chunkQueries = queries[chunk]
+            chunkIndices = indices[chunk]
+            chunkDistances = distances[chunk]
+            cells = allCells[chunk]
+            pending = np.arange(len(chunkQueries))
+
+            # the first pass visits the cell of the query and all its neighbours
+            offsets = np.concatenate([shellOffsets(0), shellOffsets(1)])
+            radius = 1
+            while len(pending) and radius <= maxRadius:
+                pendingIndices = chunkIndices[pending]
+                pendingDistances = chunkDistances[pending]
+                self.__searchCells(chunkQueries[pending], cells[pending], offsets, pendingIndices, pendingDistances)
+                chunkIndices[pending] = pendingIndices
+                chunkDistances[pending] = pendingDistances
+
+                # every point outside of the visited rings is further away than radius cells
+                pending = pending[~(pendingDistances <= (radius * self.cellSize) ** 2)]
+                radius += 1
+                offsets = shellOffsets(radius)
+
+            far.append(pending + start)
+
+        # back to the order of the points and the queries
+        result = np.empty(len(queries), dtype=np.int64)
+        result[queryOrder] = self.order[np.maximum(indices, 0)]
+        resultDistances = np.empty(len(queries))
+        resultDistances[queryOrder] = np.sqrt(distances)
+
+        # queries far away from every point, the rings of a coarser grid reach them in a few steps
+        far = np.concatenate(far) if far else np.zeros(0, dtype=np.int64)
+        if len(far):
+            result[queryOrder[far]], resultDistances[queryOrder[far]] = self.__farNearest(queries[far], chunkSize,
+                                                                                           maxRadius)
+        return result, resultDistances
+
+    def __farNearest(self, queries, chunkSize, maxRadius):
+        """
+        Find the nearest point of queries which are more than maxRadius cells away from every point
+        :param queries: numpy.ndarray, (queries x 3) positions
+        :return: (numpy.ndarray int64 nearest point index, numpy.ndarray float64 distance)
+        """
+        if self.coarse is None:
+            self.coarse = False
+            if np.any(self.dimensions > 1):
+                coarse = SpatialHash(self.points, cellSize=self.cellSize * kCoarseFactor)
+                if len(self.points) <= kMaxCoarsePointsPerCell * len(np.unique(coarse.keys)):
+                    self.coarse = coarse
+
+        if self.coarse:
+            # the cells hold more points, fewer queries are compared at once
+            return self.coarse.nearest(queries, max(1, chunkSize // kCoarseFactor ** 2), maxRadius)
+
+        # compare the queries against all the points in blocks, |q - p|^2 = |q|^2 - 2 q.p + |p|^2
+        # and |q|^2 does not change the closest point of a query
+        squaredNorms = np.einsum('ij,ij->i', self.points, self.points)
+        result = np.empty(len(queries), dtype=np.int64)
+        blockSize = max(1, kBruteForcePairs // len(self.points))
+        for start in xrange(0, len(queries), blockSize):
+            end = min(start + blockSize, len(queries))
+            result[start:end] = np.argmin(squaredNorms - 2.0 * np.dot(queries[start:end], self.points.T), axis=1)
+
+        delta = self.points[result] - queries
+        return result, np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+
+def vertexTriangles(triangles, numVertices):
+    """
+    Build the vertex to triangle adjacency
+    :param triangles: numpy.ndarray, (triangles x 3) vertex indices
+    :param numVertices: int
+    :return: (offsets, triangle indices) CSR arrays, the triangles of vertex i are
+             triangle indices[offsets[i]:offsets[i + 1]]
+    """
+    vertices = triangles.ravel()
+    order = np.argsort(vertices, kind='mergesort')
+    offsets = np.zeros(numVertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(vertices, minlength=numVertices), out=offsets[1:])
+    return offsets, (order // 3).astype(np.int64)
+
+
+def clampedBarycentric(queries, a, b, c):
+    """
+    Project the queries on their triangles and get the barycentric coordinates of the projection,
+    projections outside of the triangle are clamped back on it
+    :param queries: numpy.ndarray, (n x 3) positions
+    :param a: numpy.ndarray, (n x 3) first corner of each triangle
+    :param b: numpy.ndarray, (n x 3) second corner
+    :param c: numpy.ndarray, (n x 3) third corner
+    :return: (numpy.ndarray (n x 3) barycentric coordinates, numpy.ndarray distance to the clamped point)
+    """
+    v0 = b - a
+    v1 = c - a
+    v2 = queries - a
+    d00 = np.einsum('ij,ij->i', v0, v0)
+    d01 = np.einsum('ij,ij->i', v0, v1)
+    d11 = np.einsum('ij,ij->i', v1, v1)
+    d20 = np.einsum('ij,ij->i', v2, v0)
+    d21 = np.einsum('ij,ij->i', v2, v1)
+
+    denominator = d00 * d11 - d01 * d01
+    # degenerated triangles get all the weight on their first corner
+    degenerated = np.abs(denominator) < 1e-20
+    denominator[degenerated] = 1.0
+
+    v = (d11 * d20 - d01 * d21) / denominator
+    w = (d00 * d21 - d01 * d20) / denominator
+    barycentric = np.column_stack([1.0 - v - w, v, w])
+    barycentric[degenerated] = [1.0, 0.0, 0.0]
+
+    barycentric = np.clip(barycentric, 0.0, None)
+    barycentric /= barycentric.sum(axis=1)[:, None]
+
+    closest = barycentric[:, 0:1] * a + barycentric[:, 1:2] * b + barycentric[:, 2:3] * c
+    delta = queries - closest
+    return barycentric, np.sqrt(np.einsum('ij,ij->i', delta, delta))
+
+
+def closestTriangles(points, triangles, queries, nearest, chunkSize=65536, adjacency=None):
+    """
+    Find the closest triangle around the nearest vertex of every query and the barycentric
+    coordinates of the closest point on it
+    :param points: numpy.ndarray, (vertices x 3) source positions
+    :param triangles: numpy.ndarray, (triangles x 3) source vertex indices
+    :param queries: numpy.ndarray, (queries x 3) positions
+    :param nearest: numpy.ndarray, nearest source vertex of every query, from SpatialHash.nearest
+    :param chunkSize: int, number of queries processed at once
+    :param adjacency: (offsets, triangle indices) from vertexTriangles, built when None
+    :return: (numpy.ndarray (queries x 3) source vertex indices, numpy.ndarray (queries x 3) barycentric coordinates)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    offsets, adjacency = adjacency or vertexTriangles(triangles, len(points))
+
+    # vertices without triangles keep all the weight of the nearest vertex
+    corners = np.column_stack([nearest, nearest, nearest]).astype(np.int64)
+    barycentric = np.zeros((len(queries), 3))
+    barycentric[:, 0] = 1.0
+
+    for start in xrange(0, len(queries), chunkSize):
+        chunk = np.arange(start, min(start + chunkSize, len(queries)), dtype=np.int64)
+        counts = offsets[nearest[chunk] + 1] - offsets[nearest[chunk]]
+        total = counts.sum()
+        if not total:
+            continue
+
+        groupStarts = np.cumsum(counts) - counts
+        positions = np.repeat(offsets[nearest[chunk]] - groupStarts, counts) + np.arange(total, dtype=np.int64)
+        queryIndices = np.repeat(chunk, counts)
+        candidates = triangles[adjacency[positions]]
+
+        candidateBarycentric, distances = clampedBarycentric(queries[queryIndices], points[candidates[:, 0]],
+                                                             points[candidates[:, 1]], points[candidates[:, 2]])
+        found, closest = firstPerGroup(queryIndices, distances)
+        corners[found] = candidates[closest]
+        barycentric[found] = candidateBarycentric[closest]
+
+    return corners, barycentric
+
+
+class SurfaceIndex(object):
+    """
+    class for querying the same source surface many times, e.g. to transfer weights to several meshes,
+    the spatial hash and the triangle adjacency are only built once
+    """
+
+    def __init__(self, points, triangles=None):
+        """
+        :param points: numpy.ndarray, (vertices x 3) source positions
+        :param triangles: numpy.ndarray, (triangles x 3) source vertex indices, None only allows nearest queries
+        """
+        self.points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        self.triangles = None if triangles is None else np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        self.spatialHash = SpatialHash(self.points)
+        self.adjacency = None
+
+    def closest(self, queries, mode='barycentric'):
+        """
+        Find the source vertices and factors to interpolate at every query
+        :param queries: numpy.ndarray, (queries x 3) positions
+        :param mode: str, 'nearest' uses the nearest vertex, 'barycentric' the closest point on the triangles
+                     around it, falls back to 'nearest' without triangles
+        :return: (numpy.ndarray (queries x k) source vertex indices, numpy.ndarray (queries x k) factors)
+        """
+        nearest = self.spatialHash.nearest(queries)[0]
+        if mode == 'nearest' or self.triangles is None:
+            return nearest[:, None], np.ones((len(nearest), 1))
+
+        if self.adjacency is None:
+            self.adjacency = vertexTriangles(self.triangles, len(self.points))
+        return closestTriangles(self.points, self.triangles, np.asarray(queries, dtype=np.float64).reshape(-1, 3),
+                                nearest, adjacency=self.adjacency)
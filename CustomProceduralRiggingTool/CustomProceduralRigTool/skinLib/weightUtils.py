@@ -0,0 +1,366 @@
+"""
+weightUtils @ skinLib
+
+Array operations on skin weight matrices.
+
+Dense weights are a (vertices x influences) float64 matrix.
+Sparse weights are stored in CSR form:
+    offsets: (vertices + 1) int64, the weights of vertex i are values[offsets[i]:offsets[i + 1]]
+    indices: int32, influence column of every stored weight
+    values: float64, the non zero weights
+"""
+
+import hashlib
+import numpy as np
+
+
+def denseToSparse(weights):
+    """
+    Convert a dense weight matrix to CSR arrays, zero weights are dropped
+    :param weights: numpy.ndarray, (vertices x influences) weight matrix
+    :return: (offsets, indices, values)
+    """
+    rows, indices = np.nonzero(weights)
+    values = weights[rows, indices]
+
+    offsets = np.zeros(weights.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=weights.shape[0]), out=offsets[1:])
+
+    return offsets, indices.astype(np.int32), values.astype(np.float64)
+
+
+def sparseRows(offsets):
+    """
+    Get the vertex (row) index of every stored weight
+    :param offsets: numpy.ndarray, CSR row offsets
+    :return: numpy.ndarray, int64 row index for each value
+    """
+    return np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+
+
+def sparseToDense(offsets, indices, values, numInfluences):
+    """
+    Convert CSR arrays to a dense weight matrix
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence column of every value
+    :param values: numpy.ndarray, weights
+    :param numInfluences: int, number of columns of the dense matrix
+    :return: numpy.ndarray, (vertices x influences) weight matrix
+    """
+    weights = np.zeros((len(offsets) - 1, numInfluences), dtype=np.float64)
+    weights[sparseRows(offsets), indices] = values
+    return weights
+
+
+def concatenateSparse(blocks):
+    """
+    Stack the CSR arrays of consecutive vertex blocks into one CSR matrix
+    :param blocks: list((offsets, indices, values)), CSR arrays of each block in row order
+    :return: (offsets, indices, values)
+    """
+    if not blocks:
+        return np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float64)
+
+    offsets = [np.zeros(1, dtype=np.int64)]
+    shift = 0
+    for blockOffsets, blockIndices, blockValues in blocks:
+        offsets.append(blockOffsets[1:] + shift)
+        shift += len(blockValues)
+
+    return (np.concatenate(offsets),
+            np.concatenate([block[1] for block in blocks]),
+            np.concatenate([block[2] for block in blocks]))
+
+
+def takeSparseRows(offsets, indices, values, rows):
+    """
+    Get the CSR arrays of a subset of the rows
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence column of every value
+    :param values: numpy.ndarray, weights
+    :param rows: numpy.ndarray, int row indices to take, in the order of the result
+    :return: (offsets, indices, values) of the taken rows
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = offsets[rows + 1] - offsets[rows]
+
+    newOffsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=newOffsets[1:])
+
+    # position of every taken value in the source arrays
+    entries = np.repeat(offsets[rows] - newOffsets[:-1], counts) + np.arange(newOffsets[-1], dtype=np.int64)
+    return newOffsets, indices[entries], values[entries]
+
+
+def replaceSparseRows(offsets, indices, values, rows, rowOffsets, rowIndices, rowValues):
+    """
+    Replace some rows of a CSR matrix with the rows of another CSR matrix
+    :param offsets: numpy.ndarray, CSR row offsets of the matrix
+    :param indices: numpy.ndarray, influence columns of the matrix
+    :param values: numpy.ndarray, weights of the matrix
+    :param rows: numpy.ndarray, int unique row indices to replace
+    :param rowOffsets: numpy.ndarray, CSR row offsets of the new rows, in the order of rows
+    :param rowIndices: numpy.ndarray, influence columns of the new rows
+    :param rowValues: numpy.ndarray, weights of the new rows
+    :return: (offsets, indices, values)
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = np.diff(offsets)
+    counts[rows] = np.diff(rowOffsets)
+
+    newOffsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=newOffsets[1:])
+    newIndices = np.empty(newOffsets[-1], dtype=indices.dtype)
+    newValues = np.empty(newOffsets[-1], dtype=np.float64)
+
+    # values of the rows which are kept
+    replaced = np.zeros(len(counts), dtype=bool)
+    replaced[rows] = True
+    entryRows = sparseRows(offsets)
+    keep = ~replaced[entryRows]
+    positions = np.arange(len(values), dtype=np.int64) - offsets[entryRows]
+    destination = newOffsets[entryRows[keep]] + positions[keep]
+    newIndices[destination] = indices[keep]
+    newValues[destination] = values[keep]
+
+    # values of the new rows
+    entryRows = sparseRows(rowOffsets)
+    positions = np.arange(len(rowValues), dtype=np.int64) - rowOffsets[entryRows]
+    destination = newOffsets[rows[entryRows]] + positions
+    newIndices[destination] = rowIndices
+    newValues[destination] = rowValues
+
+    return newOffsets, newIndices, newValues
+
+
+def blockHashes(offsets, indices, values, blendWeights=None, blockSize=1024):
+    """
+    Hash the weights of consecutive vertex blocks, two matrices with the same influence order
+    have the same hash for a block if the weights of the block are the same
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence columns
+    :param values: numpy.ndarray, weights
+    :param blendWeights: numpy.ndarray, optional blendWeights hashed with the weights
+    :param blockSize: int, number of vertices per block
+    :return: list(str), hex digest of every block
+    """
+    hashes = []
+    numVertices = len(offsets) - 1
+    for start in xrange(0, numVertices, blockSize):
+        end = min(start + blockSize, numVertices)
+        lo, hi = offsets[start], offsets[end]
+
+        md5 = hashlib.md5()
+        md5.update(np.ascontiguousarray(offsets[start:end + 1] - lo, dtype=np.int64).tostring())
+        md5.update(np.ascontiguousarray(indices[lo:hi], dtype=np.int32).tostring())
+        md5.update(np.ascontiguousarray(values[lo:hi], dtype=np.float64).tostring())
+        if blendWeights is not None:
+            md5.update(np.ascontiguousarray(blendWeights[start:end], dtype=np.float64).tostring())
+        hashes.append(md5.hexdigest())
+
+    return hashes
+
+
+def blendSparseRows(offsets, indices, values, rows, factors, numInfluences):
+    """
+    Build new rows as weighted sums of existing rows, e.g. to interpolate the weights of the
+    corners of a triangle with barycentric coordinates
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence columns
+    :param values: numpy.ndarray, weights
+    :param rows: numpy.ndarray, (new rows x k) source rows of every new row
+    :param factors: numpy.ndarray, (new rows x k) factor of every source row
+    :param numInfluences: int, number of influences
+    :return: (offsets, indices, values) of the new rows
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    numRows, k = rows.shape
+    newRows = np.repeat(np.arange(numRows, dtype=np.int64), k)
+
+    taken = takeSparseRows(offsets, indices, values, rows.ravel())
+    takenRows = newRows[sparseRows(taken[0])]
+    takenValues = taken[2] * np.repeat(np.asarray(factors, dtype=np.float64).ravel(), np.diff(taken[0]))
+
+    # sum the weights of the same influence in the same new row
+    keys, inverse = np.unique(takenRows * numInfluences + taken[1], return_inverse=True)
+    summed = np.bincount(inverse, weights=takenValues)
+    keep = summed != 0.0
+    keys, summed = keys[keep], summed[keep]
+
+    newOffsets = np.zeros(numRows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // numInfluences, minlength=numRows), out=newOffsets[1:])
+    return newOffsets, (keys % numInfluences).astype(np.int32), summed
+
+
+def cleanSparse(offsets, indices, values, pruneBelow=0.0, maxInfluences=None, normalize=True, tolerance=1e-9):
+    """
+    Prune small weights, keep the largest maxInfluences weights of every vertex and renormalize,
+    all as whole-array operations
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence columns
+    :param values: numpy.ndarray, weights
+    :param pruneBelow: float, weights smaller than this are removed, except the largest weight of a vertex
+    :param maxInfluences: int, maximum number of influences per vertex, None keeps them all
+    :param normalize: bool, scale the weights of every vertex so they sum to 1
+    :param tolerance: float, a vertex counts as changed when a weight moves by more than this
+    :return: (offsets, indices, values, numpy.ndarray bool changed vertices)
+    """
+    numVertices = len(offsets) - 1
+    rows = sparseRows(offsets)
+
+    # rank the weights of every row from the largest to the smallest
+    order = np.lexsort((-values, rows))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[order] = np.arange(len(values), dtype=np.int64) - offsets[rows[order]]
+
+    # the largest weight of a vertex is never pruned, a vertex without weights would collapse
+    keep = (values > max(pruneBelow, 0.0)) | ((rank == 0) & (values > 0.0))
+    if maxInfluences is not None:
+        keep &= rank < maxInfluences
+
+    changed = np.zeros(numVertices, dtype=bool)
+    changed[rows[~keep]] = True
+
+    rows, indices, values = rows[keep], indices[keep], values[keep]
+    newOffsets = np.zeros(numVertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=numVertices), out=newOffsets[1:])
+
+    if normalize:
+        sums = np.bincount(rows, weights=values, minlength=numVertices)
+        # vertices without any weight left can not be normalized
+        valid = sums > 0
+        changed |= valid & (np.abs(sums - 1.0) > tolerance)
+        scale = np.ones(numVertices)
+        scale[valid] = 1.0 / sums[valid]
+        values = values * scale[rows]
+
+    return newOffsets, indices, values, changed
+
+
+def sparseStatistics(offsets, indices, values, numInfluences, maxInfluences=4, tolerance=1e-4):
+    """
+    Summarize the weights with whole-array reductions, to see why a mesh is expensive to skin
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence columns
+    :param values: numpy.ndarray, weights
+    :param numInfluences: int, number of influences
+    :param maxInfluences: int, influences per vertex the engine supports
+    :param tolerance: float, a vertex counts as not normalized when its weights sum differs from 1 by more than this
+    :return: dict, {'vertexCount': int,
+                    'influencesPerVertex': numpy.ndarray, number of vertices with 0, 1, 2... non zero weights,
+                    'verticesOverCap': int, vertices with more than maxInfluences non zero weights,
+                    'influenceWeights': numpy.ndarray, sum of the weights of every influence,
+                    'influenceVertices': numpy.ndarray, number of vertices weighted to every influence,
+                    'unusedInfluences': numpy.ndarray, columns without any weight,
+                    'unnormalizedVertices': int, vertices whose weights do not sum to 1,
+                    'maxNormalizationError': float, largest difference of a weights sum to 1}
+    """
+    numVertices = len(offsets) - 1
+    # explicitly stored zero weights do not cost anything in the engine
+    used = values > 0
+    rows = sparseRows(offsets)
+
+    counts = np.bincount(rows[used], minlength=numVertices)
+    influenceVertices = np.bincount(indices[used], minlength=numInfluences)
+    errors = np.abs(np.bincount(rows, weights=values, minlength=numVertices) - 1.0)
+
+    return {'vertexCount': numVertices,
+            'influencesPerVertex': np.bincount(counts, minlength=1),
+            'verticesOverCap': int(np.count_nonzero(counts > maxInfluences)),
+            'influenceWeights': np.bincount(indices[used], weights=values[used], minlength=numInfluences),
+            'influenceVertices': influenceVertices,
+            'unusedInfluences': np.flatnonzero(influenceVertices == 0),
+            'unnormalizedVertices': int(np.count_nonzero(errors > tolerance)),
+            'maxNormalizationError': float(errors.max()) if numVertices else 0.0}
+
+
+def quantizedDtype(bits):
+    """
+    :param bits: int, 8 or 16
+    :return: numpy.dtype, unsigned integer type of the quantized weights
+    """
+    if bits not in (8, 16):
+        raise ValueError('Weights can only be quantized to 8 or 16 bits, not %s' % bits)
+    return np.dtype(np.uint8 if bits == 8 else np.uint16)
+
+
+def compactIndices(indices, numInfluences):
+    """
+    Store influence columns in the smallest unsigned type which holds all the influences
+    :param indices: numpy.ndarray, influence columns
+    :param numInfluences: int, number of influences
+    :return: numpy.ndarray, uint8, uint16 or int32 influence columns
+    """
+    for dtype in [np.uint8, np.uint16]:
+        if numInfluences <= np.iinfo(dtype).max + 1:
+            return indices.astype(dtype)
+    return indices.astype(np.int32)
+
+
+def compactOffsets(offsets):
+    """
+    Store CSR row offsets as the number of weights of every row in the smallest unsigned type which holds them
+    :param offsets: numpy.ndarray, CSR row offsets
+    :return: numpy.ndarray, uint8, uint16 or int32 weights per row
+    """
+    counts = np.diff(offsets)
+    largest = counts.max() if len(counts) else 0
+    for dtype in [np.uint8, np.uint16]:
+        if largest <= np.iinfo(dtype).max:
+            return counts.astype(dtype)
+    return counts.astype(np.int32)
+
+
+def expandCounts(counts):
+    """
+    Rebuild CSR row offsets from the weights per row of compactOffsets
+    :param counts: numpy.ndarray, weights per row
+    :return: numpy.ndarray, int64 CSR row offsets
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def quantizeSparse(offsets, indices, values, bits=8):
+    """
+    Quantize the weights of every vertex to integers of the given precision. Every row is rounded with
+    the largest remainder method, so the integers of a row sum exactly to its rounded sum, e.g. 255 for a
+    normalized row in 8 bits, like the engine expects. Weights which round to zero are removed
+    :param offsets: numpy.ndarray, CSR row offsets
+    :param indices: numpy.ndarray, influence columns
+    :param values: numpy.ndarray, weights
+    :param bits: int, 8 or 16
+    :return: (offsets, indices, numpy.ndarray uint8 or uint16 quantized weights)
+    """
+    dtype = quantizedDtype(bits)
+    scale = float(np.iinfo(dtype).max)
+    numVertices = len(offsets) - 1
+    rows = sparseRows(offsets)
+
+    scaled = np.clip(values, 0.0, 1.0) * scale
+    quantized = np.floor(scaled)
+    remainders = scaled - quantized
+
+    # every row gets back the units lost by the floor, on its weights with the largest remainders
+    targets = np.round(np.bincount(rows, weights=scaled, minlength=numVertices))
+    missing = (targets - np.bincount(rows, weights=quantized, minlength=numVertices)).astype(np.int64)
+
+    order = np.lexsort((-remainders, rows))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[order] = np.arange(len(values), dtype=np.int64) - offsets[rows[order]]
+    quantized += rank < missing[rows]
+
+    keep = quantized > 0
+    newOffsets = np.zeros(numVertices + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows[keep], minlength=numVertices), out=newOffsets[1:])
+    return newOffsets, indices[keep], quantized[keep].astype(dtype)
+
+
+def dequantize(quantized):
+    """
+    Convert quantized weights back to floats
+    :param quantized: numpy.ndarray, uint8 or uint16 weights of quantizeSparse
+    :return: numpy.ndarray, float64 weights
+    """
+    return quantized.astype(np.float64) / float(np.iinfo(quantized.dtype).max)